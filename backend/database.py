@@ -3,11 +3,13 @@ Personal Engineering OS - Database Connection
 Async PostgreSQL with asyncpg
 """
 
+import asyncio
 import os
-import json
+from time import monotonic
 from typing import Any, Optional, List
 
 import asyncpg
+import orjson
 
 
 def _default_database_url() -> str:
@@ -93,11 +95,14 @@ async def get_subject_by_code(code: str) -> Optional[dict]:
 
 
 async def create_subject(code: str, name: str, credits: int, type: str, color: str) -> dict:
-    return await db.execute_returning(
+    subject = await db.execute_returning(
         """INSERT INTO subjects (code, name, credits, type, color)
            VALUES ($1, $2, $3, $4, $5) RETURNING *""",
         code, name, credits, type, color
     )
+    from scheduler import invalidate_subject_id_cache
+    invalidate_subject_id_cache()
+    return subject
 
 
 # ============================================
@@ -165,7 +170,7 @@ async def get_tasks_today() -> List[dict]:
 
 
 async def create_task(data: dict) -> dict:
-    return await db.execute_returning(
+    task = await db.execute_returning(
         """INSERT INTO tasks (title, description, subject_id, priority, 
                               duration_mins, scheduled_start, scheduled_end, is_deep_work)
            VALUES ($1, $2, $3, $4, $5, $6, $7, $8) RETURNING *""",
@@ -174,6 +179,9 @@ async def create_task(data: dict) -> dict:
         data.get('scheduled_start'), data.get('scheduled_end'),
         data.get('is_deep_work', False)
     )
+    from scheduler import invalidate_gap_cache
+    invalidate_gap_cache()
+    return task
 
 
 async def update_task(task_id: int, **updates) -> dict:
@@ -184,14 +192,19 @@ async def update_task(task_id: int, **updates) -> dict:
         values.append(v)
     values.append(task_id)
     set_clause = ", ".join(set_parts)
-    return await db.execute_returning(
+    task = await db.execute_returning(
         f"UPDATE tasks SET {set_clause}, updated_at = NOW() WHERE id = ${len(values)} RETURNING *",
         *values
     )
+    from scheduler import invalidate_gap_cache
+    invalidate_gap_cache()
+    return task
 
 
 async def delete_task(task_id: int) -> bool:
     result = await db.execute("DELETE FROM tasks WHERE id = $1", task_id)
+    from scheduler import invalidate_gap_cache
+    invalidate_gap_cache()
     return "DELETE 1" in result
 
 
@@ -298,7 +311,7 @@ async def get_ai_memory() -> List[dict]:
 
 
 async def save_ai_memory(category: str, key: str, value: str) -> dict:
-    return await db.execute_returning(
+    memory = await db.execute_returning(
         """INSERT INTO ai_memory (category, key, value)
            VALUES ($1, $2, $3)
            ON CONFLICT (category, key) 
@@ -306,6 +319,9 @@ async def save_ai_memory(category: str, key: str, value: str) -> dict:
            RETURNING *""",
         category, key, value, value
     )
+    from tools import invalidate_system_prompt_cache
+    invalidate_system_prompt_cache()
+    return memory
 
 
 async def get_ai_guidelines(active_only: bool = True) -> List[dict]:
@@ -315,10 +331,13 @@ async def get_ai_guidelines(active_only: bool = True) -> List[dict]:
 
 
 async def add_ai_guideline(rule: str, priority: int) -> dict:
-    return await db.execute_returning(
+    guideline = await db.execute_returning(
         "INSERT INTO ai_guidelines (rule, priority) VALUES ($1, $2) RETURNING *",
         rule, priority
     )
+    from tools import invalidate_system_prompt_cache
+    invalidate_system_prompt_cache()
+    return guideline
 
 
 # ============================================
@@ -376,8 +395,74 @@ async def get_version() -> dict:
     return await db.fetch_one("SELECT * FROM version_metadata ORDER BY deployed_at DESC LIMIT 1")
 
 
+# Log rows are buffered and written in batches: a flush happens once
+# LOG_BATCH_SIZE rows are waiting or LOG_FLUSH_SECONDS after the first one
+LOG_BATCH_SIZE = 100
+LOG_FLUSH_SECONDS = 1.0
+
+_log_queue: Optional[asyncio.Queue] = None
+_log_writer: Optional[asyncio.Task] = None
+
+
+async def _write_logs(rows: List[tuple]) -> None:
+    levels, messages, contexts = zip(*rows)
+    await db.execute("""
+        INSERT INTO system_logs (level, message, context)
+        SELECT * FROM unnest($1::log_level[], $2::text[], $3::jsonb[])
+    """, list(levels), list(messages), list(contexts))
+
+
+async def _log_writer_loop() -> None:
+    """Drain the log queue until the None sentinel arrives."""
+    done = False
+    while not done:
+        row = await _log_queue.get()
+        if row is None:
+            return
+        batch = [row]
+        deadline = monotonic() + LOG_FLUSH_SECONDS
+        while len(batch) < LOG_BATCH_SIZE:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                row = await asyncio.wait_for(_log_queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if row is None:
+                done = True
+                break
+            batch.append(row)
+        try:
+            await _write_logs(batch)
+        except Exception as e:
+            print(f"[SystemLog] Failed to write {len(batch)} log rows: {e}")
+
+
+def start_log_writer() -> None:
+    """Start batching system_logs writes. Call once the pool is connected."""
+    global _log_queue, _log_writer
+    if _log_writer is not None:
+        return
+    _log_queue = asyncio.Queue()
+    _log_writer = asyncio.create_task(_log_writer_loop())
+
+
+async def stop_log_writer() -> None:
+    """Flush anything still queued and stop the writer."""
+    global _log_queue, _log_writer
+    if _log_writer is None:
+        return
+    _log_queue.put_nowait(None)
+    await _log_writer
+    _log_queue = None
+    _log_writer = None
+
+
 async def log_system(level: str, message: str, context: dict = None) -> None:
-    await db.execute(
-        "INSERT INTO system_logs (level, message, context) VALUES ($1, $2, $3)",
-        level, message, json.dumps(context) if context else None
-    )
+    row = (level, message, orjson.dumps(context, default=str).decode() if context else None)
+    if _log_queue is None:
+        # Writer not running (startup, shutdown, scripts): write through
+        await _write_logs([row])
+        return
+    _log_queue.put_nowait(row)
@@ -5,7 +5,7 @@ Tracks and learns from user study patterns to make adaptive recommendations
 
 from datetime import datetime, date, time, timedelta
 from typing import Optional, List, Dict, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 from database import db
 from enum import Enum
 import statistics
@@ -38,6 +38,8 @@ class DayOfWeek(str, Enum):
 
 class LearningPattern(BaseModel):
     """Represents learned study pattern for a subject or overall"""
+    model_config = ConfigDict(frozen=True)
+
     subject_code: Optional[str] = None  # None = overall pattern
     avg_session_duration_mins: int = Field(default=45, description="Average study session length")
     best_study_time: TimeOfDay = Field(default=TimeOfDay.MORNING)
@@ -67,6 +69,8 @@ class SessionEffectiveness(BaseModel):
 
 class StudyRecommendation(BaseModel):
     """A personalized study recommendation"""
+    model_config = ConfigDict(frozen=True)
+
     recommendation_type: str  # 'schedule', 'duration', 'subject_order', 'break', 'time_of_day', 'energy'
     recommendation_text: str
     confidence_score: float = Field(ge=0.0, le=1.0)
@@ -76,6 +80,8 @@ class StudyRecommendation(BaseModel):
 
 class HourlyProductivity(BaseModel):
     """Productivity metrics by hour of day"""
+    model_config = ConfigDict(frozen=True)
+
     hour: int
     session_count: int
     avg_duration_mins: float
@@ -83,6 +89,12 @@ class HourlyProductivity(BaseModel):
     deep_work_rate: float
 
 
+# List adapters for serializing endpoint payloads in a single pydantic-core pass
+patterns_adapter = TypeAdapter(List[LearningPattern])
+hourly_adapter = TypeAdapter(List[HourlyProductivity])
+recommendations_adapter = TypeAdapter(List[StudyRecommendation])
+
+
 # ============================================
 # PATTERN ANALYZER
 # ============================================
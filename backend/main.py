@@ -10,24 +10,25 @@ from contextlib import asynccontextmanager
 from typing import Optional, List
 
 import httpx
+import orjson
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Query, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 
 from database import (
     db, get_all_subjects, get_subject_by_code, create_subject,
     get_chapters_by_subject, get_chapter, get_chapter_files,
     get_tasks_today, get_lab_reports, get_pending_revisions,
     get_streak, get_unread_notifications, get_version,
-    log_system, save_file_record
+    log_system, start_log_writer, stop_log_writer, save_file_record
 )
 from models import (
     Subject, SubjectCreate, Chapter, ChapterCreate, Task, TaskCreate,
     LabReport, LabReportCreate, ChatRequest, ChatResponse,
     HealthStatus, MorningBriefing, UserStreak, Notification,
-    AIGuideline, AIGuidelineCreate, AIMemoryCreate
+    AIGuideline, AIGuidelineCreate, AIMemoryCreate, notifications_adapter
 )
-from tools import TOOL_DEFINITIONS, execute_tool, build_system_prompt
+from tools import TOOL_DEFINITIONS_JSON, execute_tool, build_system_prompt
 from file_handler import (
     save_uploaded_file, read_file_content, validate_filename,
     list_chapter_files, SUPPORTED_EXTENSIONS
@@ -51,6 +52,7 @@ async def lifespan(app: FastAPI):
 
     # Startup
     await db.connect()
+    start_log_writer()
     os.makedirs(UPLOAD_DIR, exist_ok=True)
 
     # Initialize notification system
@@ -69,6 +71,7 @@ async def lifespan(app: FastAPI):
     # Shutdown
     await notification_service.stop()
     await log_system("info", "Server shutting down")
+    await stop_log_writer()
     await db.disconnect()
 
 
@@ -76,7 +79,9 @@ app = FastAPI(
     title="Personal Engineering OS",
     description="AI-powered study management system for KU students",
     version="1.0.1",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # Handlers return list-of-dict rows; encode them with orjson
+    default_response_class=ORJSONResponse
 )
 
 # CORS for frontend
@@ -144,12 +149,13 @@ async def chat_with_ai(request: ChatRequest):
             
             response = await client.post(
                 f"{COPILOT_API_URL}/v1/chat/completions",
-                json={
+                content=orjson.dumps({
                     "model": model_name,
                     "messages": messages,
-                    "tools": TOOL_DEFINITIONS,
+                    "tools": TOOL_DEFINITIONS_JSON,
                     "tool_choice": "auto"
-                },
+                }),
+                headers={"Content-Type": "application/json"},
                 timeout=60
             )
             
@@ -462,10 +468,20 @@ async def get_streak_info():
 # NOTIFICATIONS
 # ============================================
 
-@app.get("/api/notifications", response_model=List[dict])
+# The handler encodes through notifications_adapter itself, so the schema is
+# documented via responses= rather than applied as a response_model
+@app.get(
+    "/api/notifications",
+    response_model=None,
+    responses={200: {"model": List[Notification], "description": "Unread notifications"}}
+)
 async def list_notifications():
     """Get unread notifications."""
-    return await get_unread_notifications()
+    rows = await get_unread_notifications()
+    return Response(
+        content=notifications_adapter.dump_json(notifications_adapter.validate_python(rows)),
+        media_type="application/json"
+    )
 
 
 @app.post("/api/notifications/{notification_id}/read")
@@ -526,8 +542,11 @@ async def websocket_notifications(websocket: WebSocket):
                 pass
 
     except WebSocketDisconnect:
-        await unregister_client(websocket)
-    except Exception as e:
+        pass
+    except Exception:
+        pass
+    finally:
+        # Always release the client's channel, including on task cancellation
         await unregister_client(websocket)
 
 
@@ -878,12 +897,12 @@ async def update_setting_endpoint(
 @app.get("/api/labs/countdown")
 async def get_lab_report_countdown():
     """Get pending lab reports with countdown."""
-    from scheduler import get_lab_report_countdown
+    from scheduler import get_lab_report_countdown, URGENT_LAB_URGENCIES
     reports = await get_lab_report_countdown()
     return {
         "reports": reports,
         "total": len(reports),
-        "urgent": len([r for r in reports if r["urgency"] in ("overdue", "urgent")])
+        "urgent": sum(1 for r in reports if r["urgency"] in URGENT_LAB_URGENCIES)
     }
 
 
@@ -1514,9 +1533,9 @@ async def reset_pomodoro():
 @app.get("/api/patterns")
 async def get_all_learning_patterns():
     """Get all cached learning patterns."""
-    from learning_patterns import get_all_patterns
+    from learning_patterns import get_all_patterns, patterns_adapter
     patterns = await get_all_patterns()
-    return {"patterns": [p.model_dump() for p in patterns], "count": len(patterns)}
+    return {"patterns": patterns_adapter.dump_python(patterns, mode="json"), "count": len(patterns)}
 
 
 @app.get("/api/patterns/overall")
@@ -1541,11 +1560,11 @@ async def get_hourly_productivity_endpoint(
     subject_code: Optional[str] = None
 ):
     """Get productivity breakdown by hour of day."""
-    from learning_patterns import PatternAnalyzer
+    from learning_patterns import PatternAnalyzer, hourly_adapter
     analyzer = PatternAnalyzer()
     hourly = await analyzer.get_hourly_productivity(days, subject_code.upper() if subject_code else None)
     return {
-        "hourly_data": [h.model_dump() for h in hourly],
+        "hourly_data": hourly_adapter.dump_python(hourly, mode="json"),
         "days_analyzed": days,
         "subject": subject_code
     }
@@ -1604,7 +1623,7 @@ async def get_study_recommendations_endpoint(
     planned_duration: Optional[int] = None
 ):
     """Get personalized study recommendations."""
-    from learning_patterns import RecommendationEngine
+    from learning_patterns import RecommendationEngine, recommendations_adapter
     engine = RecommendationEngine()
     context = {}
     if subject_code:
@@ -1614,7 +1633,7 @@ async def get_study_recommendations_endpoint(
 
     recommendations = await engine.get_recommendations(context)
     return {
-        "recommendations": [r.model_dump() for r in recommendations],
+        "recommendations": recommendations_adapter.dump_python(recommendations, mode="json"),
         "count": len(recommendations),
         "context": context
     }
@@ -1648,4 +1667,4 @@ async def suggest_session_duration_endpoint(
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_per_message_deflate=False)
@@ -5,7 +5,7 @@ Personal Engineering OS - Pydantic Models (v2 syntax)
 from datetime import datetime
 from enum import Enum
 from typing import Optional, List, Any
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 
 
 # ============================================
@@ -67,7 +67,7 @@ class SubjectCreate(SubjectBase):
 
 
 class Subject(SubjectBase):
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, frozen=True)
     
     id: int
     created_at: datetime
@@ -88,6 +88,8 @@ class ChapterCreate(ChapterBase):
 
 
 class ChapterProgress(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     reading_status: ProgressStatus = ProgressStatus.NOT_STARTED
     assignment_status: AssignmentStatus = AssignmentStatus.LOCKED
     mastery_level: int = 0
@@ -97,7 +99,7 @@ class ChapterProgress(BaseModel):
 
 
 class Chapter(ChapterBase):
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, frozen=True)
     
     id: int
     subject_id: int
@@ -126,7 +128,7 @@ class TaskCreate(TaskBase):
 
 
 class Task(TaskBase):
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, frozen=True)
     
     id: int
     status: TaskStatus
@@ -150,7 +152,7 @@ class LabReportCreate(LabReportBase):
 
 
 class LabReport(LabReportBase):
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, frozen=True)
     
     id: int
     status: TaskStatus
@@ -174,6 +176,8 @@ class ChatRequest(BaseModel):
 
 
 class ChatResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     response: str
     tool_calls: Optional[List[dict]] = None
     notifications: Optional[List[dict]] = None
@@ -193,8 +197,12 @@ class AIMemoryCreate(BaseModel):
 # ============================================
 # API RESPONSE MODELS
 # ============================================
+# Response models are frozen: handlers build them once from trusted rows
+# and never mutate them before serialization.
 
 class HealthStatus(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     status: str = "healthy"
     version: str = "1.0.1"
     database: str = "connected"
@@ -202,6 +210,8 @@ class HealthStatus(BaseModel):
 
 
 class MorningBriefing(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     greeting: str
     current_streak: int
     streak_icon: str = ""
@@ -214,7 +224,7 @@ class MorningBriefing(BaseModel):
 
 
 class UserStreak(BaseModel):
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, frozen=True)
     
     id: int
     current_streak: int = 0
@@ -226,7 +236,7 @@ class UserStreak(BaseModel):
 
 
 class Notification(BaseModel):
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, frozen=True)
     
     id: int
     type: NotificationType
@@ -238,8 +248,12 @@ class Notification(BaseModel):
     created_at: datetime
 
 
+# Validates and dumps a whole notification list in one pydantic-core call
+notifications_adapter = TypeAdapter(List[Notification])
+
+
 class AIGuideline(BaseModel):
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(from_attributes=True, frozen=True)
     
     id: int
     rule: str
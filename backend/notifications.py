@@ -4,12 +4,17 @@ AI-driven notifications for reminders, achievements, suggestions, and warnings
 """
 
 import asyncio
-import json
+import functools
+import hashlib
+import random
 from datetime import datetime, date, time, timedelta
 from typing import Optional, List, Dict, Set
 from enum import Enum
 
-from database import db
+import asyncpg
+import orjson
+
+from database import db, get_database_url
 
 
 # ============================================
@@ -31,14 +36,33 @@ class NotificationPriority(str, Enum):
     URGENT = "urgent"
 
 
-# Connected WebSocket clients
-connected_clients: Set = set()
+# Connected WebSocket clients, mapped to their outbound ClientChannel
+connected_clients: Dict = {}
+
+# Channel raised by the notify_notification_wakeup() triggers
+WAKEUP_CHANNEL = "notif_wakeup"
+# Channel carrying encoded broadcasts to every worker process
+BROADCAST_CHANNEL = "notif_broadcast"
+# Postgres rejects NOTIFY payloads of 8000 bytes or more
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+# A client that can't accept a frame within this many seconds is dropped
+BROADCAST_SEND_TIMEOUT = 5.0
+# A client whose outbound queue fills up is disconnected rather than buffered
+CLIENT_QUEUE_SIZE = 256
+# Larger audiences are enqueued in batches, yielding to the event loop in between
+BROADCAST_BATCH_SIZE = 50
 
 
 # ============================================
 # DATABASE OPERATIONS
 # ============================================
 
+def make_dedup_key(*parts) -> str:
+    """Fixed-length dedup key: md5 of the logical key parts (for size, not security)."""
+    return hashlib.md5("|".join(map(str, parts)).encode()).hexdigest()
+
+
 async def create_notification(
     notif_type: str,
     title: str,
@@ -53,23 +77,16 @@ async def create_notification(
 ) -> Optional[Dict]:
     """
     Create a new notification in the database.
-    Uses dedup_key to prevent duplicate notifications.
+    Uses dedup_key to prevent duplicate notifications: the insert is a
+    no-op returning None when the key already exists.
     """
-    # Check for duplicates if dedup_key provided
-    if dedup_key:
-        existing = await db.fetch_one("""
-            SELECT id FROM proactive_notifications
-            WHERE dedup_key = $1 AND dismissed = false
-        """, dedup_key)
-        if existing:
-            return None  # Already exists, skip
-
     notification = await db.execute_returning("""
         INSERT INTO proactive_notifications (
             type, title, message, priority,
             action_url, action_label, scheduled_for,
             reference_type, reference_id, dedup_key
         ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+        ON CONFLICT (dedup_key) DO NOTHING
         RETURNING *
     """,
         notif_type, title, message, priority,
@@ -81,7 +98,10 @@ async def create_notification(
 
 
 async def get_pending_notifications() -> List[Dict]:
-    """Get all unsent notifications that should be sent now."""
+    """Get all unsent notifications that should be sent now.
+
+    The ORDER BY must stay in sync with idx_proactive_notif_pending.
+    """
     return await db.fetch("""
         SELECT * FROM proactive_notifications
         WHERE sent = false
@@ -108,6 +128,21 @@ async def mark_notification_sent(notification_id: int) -> Dict:
     """, notification_id)
 
 
+async def mark_notifications_sent(notification_ids: List[int]) -> List[int]:
+    """
+    Mark several notifications as sent in one statement.
+    Returns only the ids this call claimed, so concurrent workers never
+    send the same notification twice.
+    """
+    rows = await db.fetch("""
+        UPDATE proactive_notifications
+        SET sent = true, sent_at = NOW()
+        WHERE id = ANY($1::int[]) AND sent = false
+        RETURNING id
+    """, notification_ids)
+    return [row["id"] for row in rows]
+
+
 async def mark_notification_read(notification_id: int) -> Dict:
     """Mark notification as read by user."""
     return await db.execute_returning("""
@@ -184,48 +219,35 @@ async def update_notification_preference(
     frequency_limit: Optional[int] = None
 ) -> Dict:
     """Update notification preferences for a type."""
-    # Build update query dynamically
-    updates = []
-    values = []
-    param_idx = 1
-
-    if enabled is not None:
-        updates.append(f"enabled = ${param_idx}")
-        values.append(enabled)
-        param_idx += 1
-
-    if quiet_hours_start is not None:
-        updates.append(f"quiet_hours_start = ${param_idx}")
-        values.append(quiet_hours_start)
-        param_idx += 1
-
-    if quiet_hours_end is not None:
-        updates.append(f"quiet_hours_end = ${param_idx}")
-        values.append(quiet_hours_end)
-        param_idx += 1
-
-    if frequency_limit is not None:
-        updates.append(f"frequency_limit = ${param_idx}")
-        values.append(frequency_limit)
-        param_idx += 1
-
-    if not updates:
+    if enabled is None and quiet_hours_start is None and quiet_hours_end is None and frequency_limit is None:
         return {"error": "No updates provided"}
 
-    values.append(notification_type)
-
-    result = await db.execute_returning(f"""
-        INSERT INTO notification_preferences (notification_type, {', '.join(u.split(' = ')[0] for u in updates)})
-        VALUES (${param_idx}, {', '.join(f'${i+1}' for i in range(len(values)-1))})
+    # Static upsert so asyncpg can reuse one prepared statement;
+    # NULL parameters leave the stored value untouched.
+    result = await db.execute_returning("""
+        INSERT INTO notification_preferences (
+            notification_type, enabled, quiet_hours_start, quiet_hours_end, frequency_limit
+        ) VALUES ($1, COALESCE($2, true), $3, $4, $5)
         ON CONFLICT (notification_type) DO UPDATE SET
-            {', '.join(updates)},
+            enabled = COALESCE($2, notification_preferences.enabled),
+            quiet_hours_start = COALESCE($3, notification_preferences.quiet_hours_start),
+            quiet_hours_end = COALESCE($4, notification_preferences.quiet_hours_end),
+            frequency_limit = COALESCE($5, notification_preferences.frequency_limit),
             updated_at = NOW()
         RETURNING *
-    """, *values)
+    """, notification_type, enabled, quiet_hours_start, quiet_hours_end, frequency_limit)
 
     return result
 
 
+@functools.lru_cache(maxsize=64)
+def _parse_hm(value) -> time:
+    """Parse an "HH:MM" quiet-hours value (TIME columns arrive already parsed)."""
+    if isinstance(value, time):
+        return value
+    return datetime.strptime(value, "%H:%M").time()
+
+
 async def is_notification_allowed(notification_type: str) -> bool:
     """Check if notification type is allowed based on preferences."""
     pref = await db.fetch_one("""
@@ -234,26 +256,36 @@ async def is_notification_allowed(notification_type: str) -> bool:
         WHERE notification_type = $1
     """, notification_type)
 
+    return await get_remaining_quota(notification_type, pref) != 0
+
+
+async def get_remaining_quota(notification_type: str, pref: Optional[Dict]) -> Optional[int]:
+    """
+    How many more notifications of this type may be sent right now.
+
+    Returns None when unlimited and 0 when disabled, in quiet hours or
+    over the daily frequency limit.
+    """
     if not pref:
-        return True  # Default: allow all
+        return None  # Default: allow all
 
     if not pref["enabled"]:
-        return False
+        return 0
 
     # Check quiet hours
     if pref["quiet_hours_start"] and pref["quiet_hours_end"]:
         now = datetime.now().time()
         try:
-            quiet_start = datetime.strptime(pref["quiet_hours_start"], "%H:%M").time()
-            quiet_end = datetime.strptime(pref["quiet_hours_end"], "%H:%M").time()
+            quiet_start = _parse_hm(pref["quiet_hours_start"])
+            quiet_end = _parse_hm(pref["quiet_hours_end"])
 
             # Handle overnight quiet hours (e.g., 22:00 to 07:00)
             if quiet_start > quiet_end:
                 if now >= quiet_start or now <= quiet_end:
-                    return False
+                    return 0
             else:
                 if quiet_start <= now <= quiet_end:
-                    return False
+                    return 0
         except ValueError:
             pass
 
@@ -263,19 +295,20 @@ async def is_notification_allowed(notification_type: str) -> bool:
             SELECT COUNT(*) as count
             FROM proactive_notifications
             WHERE type = $1
-              AND DATE(created_at) = CURRENT_DATE
+              AND created_at >= CURRENT_DATE
+              AND created_at < CURRENT_DATE + 1
         """, notification_type)
 
-        if today_count and today_count["count"] >= pref["frequency_limit"]:
-            return False
+        sent_today = today_count["count"] if today_count else 0
+        return max(pref["frequency_limit"] - sent_today, 0)
 
-    return True
+    return None
 
 
 def get_next_available_time(quiet_end: str) -> datetime:
     """Calculate next available time after quiet hours end."""
     now = datetime.now()
-    quiet_end_time = datetime.strptime(quiet_end, "%H:%M").time()
+    quiet_end_time = _parse_hm(quiet_end)
     next_available = datetime.combine(now.date(), quiet_end_time)
 
     if next_available <= now:
@@ -299,31 +332,81 @@ class NotificationGenerator:
 
     BREAK_THRESHOLD_MINS = 90  # Suggest break after 90 mins
 
+    BASE_MOTIVATION_MESSAGES = (
+        ("Rise and shine! Ready to learn something new today?", "normal"),
+        ("New day, new opportunities to grow. Let's make it count!", "normal"),
+        ("Small consistent steps lead to big achievements. Keep going!", "normal"),
+    )
+
+    def __init__(self):
+        # Per-pass state, reset by check_and_generate()
+        self._preferences: Dict[str, Dict] = {}
+        self._quota: Dict[str, Optional[int]] = {}
+        self._quota_locks: Dict[str, asyncio.Lock] = {}
+
+    async def _load_quota(self, key: str) -> Optional[int]:
+        """Remaining quota for key; caller holds the key's lock."""
+        if key not in self._quota:
+            self._quota[key] = await get_remaining_quota(key, self._preferences.get(key))
+        return self._quota[key]
+
+    async def _is_allowed(self, notification_type: str) -> bool:
+        """is_notification_allowed() memoized for the current pass.
+
+        Only a pre-check to skip work: checks run concurrently, so _create()
+        re-checks the quota under the same lock before inserting.
+        """
+        key = getattr(notification_type, "value", notification_type)
+        async with self._quota_locks.setdefault(key, asyncio.Lock()):
+            return await self._load_quota(key) != 0
+
+    async def _create(self, notif_type: str, **kwargs) -> Optional[Dict]:
+        """create_notification() that also consumes the pass's quota.
+
+        The quota check and the insert happen under the type's lock, so
+        concurrent checks of one type can't both take the last slot; a dedup
+        no-op leaves the quota untouched.
+        """
+        key = getattr(notif_type, "value", notif_type)
+        async with self._quota_locks.setdefault(key, asyncio.Lock()):
+            remaining = await self._load_quota(key)
+            if remaining == 0:
+                return None
+            notif = await create_notification(notif_type=notif_type, **kwargs)
+            if notif and remaining is not None:
+                self._quota[key] = remaining - 1
+        return notif
+
     async def check_and_generate(self) -> List[Dict]:
         """Run all notification checks and generate notifications."""
         notifications = []
 
         try:
-            # Check deadlines
-            notifications.extend(await self.check_deadlines())
-
-            # Check break needs
-            notifications.extend(await self.check_break_needed())
-
-            # Check revisions due
-            notifications.extend(await self.check_revisions())
-
-            # Check achievements
-            notifications.extend(await self.check_achievements())
-
-            # Daily motivation
-            notifications.extend(await self.check_daily_motivation())
-
-            # Overwork warning
-            notifications.extend(await self.check_overwork())
+            # Load preferences once; quotas are resolved lazily per type
+            self._preferences = {
+                p["notification_type"]: p for p in await get_notification_preferences()
+            }
+            self._quota = {}
+            self._quota_locks = {}
+
+            # The checks are independent, so run them concurrently on
+            # separate pool connections; one failing check doesn't skip the rest
+            results = await asyncio.gather(
+                self.check_deadlines(),
+                self.check_break_needed(),
+                self.check_revisions(),
+                self.check_achievements(),
+                self.check_daily_motivation(),
+                self.check_overwork(),
+                self.check_streak_at_risk(),
+                return_exceptions=True
+            )
 
-            # Streak warning
-            notifications.extend(await self.check_streak_at_risk())
+            for result in results:
+                if isinstance(result, Exception):
+                    print(f"Error generating notifications: {result}")
+                else:
+                    notifications.extend(result)
 
         except Exception as e:
             print(f"Error generating notifications: {e}")
@@ -333,78 +416,71 @@ class NotificationGenerator:
     async def check_deadlines(self) -> List[Dict]:
         """Check for upcoming deadlines and generate reminders."""
         notifications = []
-        now = datetime.now()
 
-        # Get upcoming deadlines (tasks, lab reports, goals)
-        deadlines = []
-
-        # Tasks with deadlines
-        tasks = await db.fetch("""
+        # Get upcoming deadlines (tasks, lab reports, goals) in one round-trip,
+        # each already classified into its tightest DEADLINE_THRESHOLDS bucket
+        deadlines = await db.fetch("""
             SELECT
-                t.id, t.title, t.scheduled_start as deadline,
-                s.code as subject_code, 'task' as item_type
-            FROM tasks t
-            LEFT JOIN subjects s ON t.subject_id = s.id
-            WHERE t.status NOT IN ('completed', 'cancelled')
-              AND t.scheduled_start IS NOT NULL
-              AND t.scheduled_start BETWEEN NOW() AND NOW() + INTERVAL '25 hours'
+                d.*,
+                CASE
+                    WHEN d.deadline <= NOW() + INTERVAL '1 hour' THEN '1h'
+                    WHEN d.deadline <= NOW() + INTERVAL '4 hours' THEN '4h'
+                    ELSE '24h'
+                END as threshold
+            FROM (
+                SELECT
+                    t.id, t.title, t.scheduled_start as deadline,
+                    s.code as subject_code, 'task' as item_type
+                FROM tasks t
+                LEFT JOIN subjects s ON t.subject_id = s.id
+                WHERE t.status NOT IN ('completed', 'cancelled')
+                  AND t.scheduled_start IS NOT NULL
+                  AND t.scheduled_start BETWEEN NOW() AND NOW() + INTERVAL '25 hours'
+
+                UNION ALL
+
+                SELECT
+                    lr.id, lr.experiment_name as title, lr.deadline,
+                    s.code as subject_code, 'lab_report' as item_type
+                FROM lab_reports lr
+                JOIN subjects s ON lr.subject_id = s.id
+                WHERE lr.status NOT IN ('completed', 'cancelled')
+                  AND lr.deadline BETWEEN NOW() AND NOW() + INTERVAL '25 hours'
+
+                UNION ALL
+
+                SELECT
+                    sg.id, sg.title, sg.deadline::timestamp as deadline,
+                    COALESCE(s.code, 'General') as subject_code, 'goal' as item_type
+                FROM study_goals sg
+                LEFT JOIN subjects s ON sg.subject_id = s.id
+                WHERE sg.completed = false
+                  AND sg.deadline IS NOT NULL
+                  AND sg.deadline BETWEEN CURRENT_DATE AND CURRENT_DATE + 1
+            ) d
+            WHERE d.deadline > NOW()
+              AND d.deadline <= NOW() + INTERVAL '24 hours'
         """)
-        deadlines.extend(tasks)
-
-        # Lab reports
-        labs = await db.fetch("""
-            SELECT
-                lr.id, lr.experiment_name as title, lr.deadline,
-                s.code as subject_code, 'lab_report' as item_type
-            FROM lab_reports lr
-            JOIN subjects s ON lr.subject_id = s.id
-            WHERE lr.status NOT IN ('completed', 'cancelled')
-              AND lr.deadline BETWEEN NOW() AND NOW() + INTERVAL '25 hours'
-        """)
-        deadlines.extend(labs)
-
-        # Goals with deadlines
-        goals = await db.fetch("""
-            SELECT
-                sg.id, sg.title, sg.deadline::timestamp as deadline,
-                COALESCE(s.code, 'General') as subject_code, 'goal' as item_type
-            FROM study_goals sg
-            LEFT JOIN subjects s ON sg.subject_id = s.id
-            WHERE sg.completed = false
-              AND sg.deadline IS NOT NULL
-              AND sg.deadline BETWEEN CURRENT_DATE AND CURRENT_DATE + 1
-        """)
-        deadlines.extend(goals)
 
         for item in deadlines:
-            if not item["deadline"]:
-                continue
-
-            deadline_dt = item["deadline"]
-            if isinstance(deadline_dt, date) and not isinstance(deadline_dt, datetime):
-                deadline_dt = datetime.combine(deadline_dt, time(23, 59))
-
-            hours_until = (deadline_dt - now).total_seconds() / 3600
-
-            for threshold_key, (hours, priority, prefix) in self.DEADLINE_THRESHOLDS.items():
-                if 0 < hours_until <= hours:
-                    dedup_key = f"deadline_{item['item_type']}_{item['id']}_{threshold_key}"
-
-                    if await is_notification_allowed(NotificationType.REMINDER):
-                        notif = await create_notification(
-                            notif_type=NotificationType.REMINDER,
-                            title=f"{prefix}: {item['title']}",
-                            message=f"{item['item_type'].replace('_', ' ').title()} for {item['subject_code']} is due soon.",
-                            priority=priority,
-                            action_url=f"/schedule",
-                            action_label="View Schedule",
-                            reference_type=item["item_type"],
-                            reference_id=item["id"],
-                            dedup_key=dedup_key
-                        )
-                        if notif:
-                            notifications.append(notif)
-                    break
+            threshold_key = item["threshold"]
+            _, priority, prefix = self.DEADLINE_THRESHOLDS[threshold_key]
+            dedup_key = make_dedup_key("deadline", item["item_type"], item["id"], threshold_key)
+
+            if await self._is_allowed(NotificationType.REMINDER):
+                notif = await self._create(
+                    notif_type=NotificationType.REMINDER,
+                    title=f"{prefix}: {item['title']}",
+                    message=f"{item['item_type'].replace('_', ' ').title()} for {item['subject_code']} is due soon.",
+                    priority=priority,
+                    action_url=f"/schedule",
+                    action_label="View Schedule",
+                    reference_type=item["item_type"],
+                    reference_id=item["id"],
+                    dedup_key=dedup_key
+                )
+                if notif:
+                    notifications.append(notif)
 
         return notifications
 
@@ -428,10 +504,10 @@ class NotificationGenerator:
 
             if elapsed_mins >= self.BREAK_THRESHOLD_MINS:
                 # Check if we already sent a break notification recently
-                dedup_key = f"break_suggestion_{active_timer['session_id']}_{elapsed_mins // 30}"
+                dedup_key = make_dedup_key("break_suggestion", active_timer["session_id"], elapsed_mins // 30)
 
-                if await is_notification_allowed(NotificationType.SUGGESTION):
-                    notif = await create_notification(
+                if await self._is_allowed(NotificationType.SUGGESTION):
+                    notif = await self._create(
                         notif_type=NotificationType.SUGGESTION,
                         title="Time for a break!",
                         message=f"You've been studying for {elapsed_mins} minutes. Take a short break to maintain focus.",
@@ -463,14 +539,14 @@ class NotificationGenerator:
             ORDER BY rs.due_date, s.credits DESC
         """)
 
-        if revisions and await is_notification_allowed(NotificationType.REMINDER):
+        if revisions and await self._is_allowed(NotificationType.REMINDER):
             # Create a single notification for all due revisions
             count = len(revisions)
             first_rev = revisions[0]
 
-            dedup_key = f"revisions_due_{date.today()}"
+            dedup_key = make_dedup_key("revisions_due", date.today())
 
-            notif = await create_notification(
+            notif = await self._create(
                 notif_type=NotificationType.REMINDER,
                 title=f"{count} Revision{'s' if count > 1 else ''} Due",
                 message=f"You have {count} chapter revision{'s' if count > 1 else ''} due. "
@@ -491,18 +567,17 @@ class NotificationGenerator:
 
         # Get unlocked but not notified achievements
         achievements = await db.fetch("""
-            SELECT id, name, description, icon, points_reward
-            FROM achievements
-            WHERE unlocked = true
-              AND id NOT IN (
-                  SELECT reference_id FROM proactive_notifications
-                  WHERE reference_type = 'achievement' AND reference_id IS NOT NULL
-              )
+            SELECT a.id, a.name, a.description, a.icon, a.points_reward
+            FROM achievements a
+            LEFT JOIN proactive_notifications pn
+                ON pn.reference_type = 'achievement' AND pn.reference_id = a.id
+            WHERE a.unlocked = true
+              AND pn.id IS NULL
         """)
 
         for achievement in achievements:
-            if await is_notification_allowed(NotificationType.ACHIEVEMENT):
-                notif = await create_notification(
+            if await self._is_allowed(NotificationType.ACHIEVEMENT):
+                notif = await self._create(
                     notif_type=NotificationType.ACHIEVEMENT,
                     title=f"Achievement Unlocked: {achievement['name']}!",
                     message=f"{achievement['icon']} {achievement['description']} (+{achievement['points_reward']} points)",
@@ -511,7 +586,7 @@ class NotificationGenerator:
                     action_label="View Achievements",
                     reference_type="achievement",
                     reference_id=achievement["id"],
-                    dedup_key=f"achievement_{achievement['id']}"
+                    dedup_key=make_dedup_key("achievement", achievement["id"])
                 )
                 if notif:
                     notifications.append(notif)
@@ -523,21 +598,23 @@ class NotificationGenerator:
         notifications = []
         today = date.today()
 
+        # Only send in the morning (6 AM - 9 AM); checked before touching the DB
+        current_hour = datetime.now().hour
+        if current_hour < 6 or current_hour >= 9:
+            return notifications
+
         # Check if already sent today
         existing = await db.fetch_one("""
             SELECT id FROM proactive_notifications
-            WHERE type = $1 AND DATE(created_at) = $2
+            WHERE type = $1
+              AND created_at >= $2::date
+              AND created_at < $2::date + 1
         """, NotificationType.MOTIVATION, today)
 
         if existing:
             return notifications
 
-        # Only send in the morning (6 AM - 9 AM)
-        current_hour = datetime.now().hour
-        if current_hour < 6 or current_hour >= 9:
-            return notifications
-
-        if not await is_notification_allowed(NotificationType.MOTIVATION):
+        if not await self._is_allowed(NotificationType.MOTIVATION):
             return notifications
 
         # Get streak and stats
@@ -549,17 +626,14 @@ class NotificationGenerator:
         yesterday_stats = await db.fetch_one("""
             SELECT COALESCE(SUM(duration_seconds), 0) as total_seconds
             FROM study_sessions
-            WHERE DATE(started_at) = CURRENT_DATE - 1
+            WHERE started_at >= CURRENT_DATE - 1
+              AND started_at < CURRENT_DATE
               AND stopped_at IS NOT NULL
         """)
         yesterday_mins = (yesterday_stats["total_seconds"] or 0) // 60
 
         # Build motivational message
-        messages = [
-            ("Rise and shine! Ready to learn something new today?", "normal"),
-            ("New day, new opportunities to grow. Let's make it count!", "normal"),
-            ("Small consistent steps lead to big achievements. Keep going!", "normal"),
-        ]
+        messages = list(self.BASE_MOTIVATION_MESSAGES)
 
         if current_streak >= 7:
             messages.append((f"Amazing! You're on a {current_streak}-day streak. Keep the momentum!", "high"))
@@ -569,15 +643,14 @@ class NotificationGenerator:
         if yesterday_mins >= 120:
             messages.append((f"You studied {yesterday_mins} minutes yesterday. Impressive dedication!", "normal"))
 
-        import random
         message, priority = random.choice(messages)
 
-        notif = await create_notification(
+        notif = await self._create(
             notif_type=NotificationType.MOTIVATION,
             title="Good Morning!",
             message=message,
             priority=priority,
-            dedup_key=f"motivation_{today}"
+            dedup_key=make_dedup_key("motivation", today)
         )
         if notif:
             notifications.append(notif)
@@ -588,55 +661,53 @@ class NotificationGenerator:
         """Check if user is overworking."""
         notifications = []
 
-        # Get today's total study time
+        # Today's completed study time plus the running timer, in one round-trip
         today_stats = await db.fetch_one("""
             SELECT
-                COALESCE(SUM(duration_seconds), 0) as total_seconds,
-                COUNT(*) as session_count
-            FROM study_sessions
-            WHERE DATE(started_at) = CURRENT_DATE
-              AND stopped_at IS NOT NULL
-        """)
-
-        # Also check active timer
-        active_timer = await db.fetch_one("""
-            SELECT EXTRACT(EPOCH FROM (NOW() - started_at))::INTEGER as elapsed_seconds
-            FROM active_timer
-            LIMIT 1
+                COALESCE((
+                    SELECT SUM(duration_seconds)
+                    FROM study_sessions
+                    WHERE started_at >= CURRENT_DATE
+                      AND started_at < CURRENT_DATE + 1
+                      AND stopped_at IS NOT NULL
+                ), 0)
+                + COALESCE((
+                    SELECT EXTRACT(EPOCH FROM (NOW() - started_at))::INTEGER
+                    FROM active_timer
+                    LIMIT 1
+                ), 0) as total_seconds
         """)
 
         total_seconds = today_stats["total_seconds"] or 0
-        if active_timer:
-            total_seconds += active_timer["elapsed_seconds"]
 
         total_hours = total_seconds / 3600
 
         if total_hours >= 10:
             # Urgent: Stop studying
-            if await is_notification_allowed(NotificationType.WARNING):
-                notif = await create_notification(
+            if await self._is_allowed(NotificationType.WARNING):
+                notif = await self._create(
                     notif_type=NotificationType.WARNING,
                     title="Please take a rest!",
                     message=f"You've studied over {int(total_hours)} hours today. Your brain needs rest to consolidate learning.",
                     priority="urgent",
                     action_url="/timer",
                     action_label="Stop Timer",
-                    dedup_key=f"overwork_10h_{date.today()}"
+                    dedup_key=make_dedup_key("overwork_10h", date.today())
                 )
                 if notif:
                     notifications.append(notif)
 
         elif total_hours >= 8:
             # Warning: Consider stopping
-            if await is_notification_allowed(NotificationType.WARNING):
-                notif = await create_notification(
+            if await self._is_allowed(NotificationType.WARNING):
+                notif = await self._create(
                     notif_type=NotificationType.WARNING,
                     title="Extended study session",
                     message=f"You've studied {int(total_hours)} hours today. Consider wrapping up soon for better retention.",
                     priority="high",
                     action_url="/analytics",
                     action_label="View Stats",
-                    dedup_key=f"overwork_8h_{date.today()}"
+                    dedup_key=make_dedup_key("overwork_8h", date.today())
                 )
                 if notif:
                     notifications.append(notif)
@@ -669,15 +740,15 @@ class NotificationGenerator:
         # If last activity was yesterday and it's getting late
         if last_activity and last_activity == today - timedelta(days=1):
             # After 8 PM, warn about streak
-            if now.hour >= 20 and await is_notification_allowed(NotificationType.WARNING):
-                notif = await create_notification(
+            if now.hour >= 20 and await self._is_allowed(NotificationType.WARNING):
+                notif = await self._create(
                     notif_type=NotificationType.WARNING,
                     title="Protect your streak!",
                     message=f"Your {current_streak}-day streak is at risk! Study for at least 30 minutes today to keep it going.",
                     priority="high",
                     action_url="/timer",
                     action_label="Start Studying",
-                    dedup_key=f"streak_at_risk_{today}"
+                    dedup_key=make_dedup_key("streak_at_risk", today)
                 )
                 if notif:
                     notifications.append(notif)
@@ -697,6 +768,9 @@ class NotificationService:
         self.generator = NotificationGenerator()
         self.running = False
         self._task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._listener: Optional[asyncpg.Connection] = None
+        self._deliveries: Set[asyncio.Task] = set()
 
     async def start(self):
         """Start the notification service."""
@@ -704,6 +778,7 @@ class NotificationService:
             return
 
         self.running = True
+        await self._start_listener()
         self._task = asyncio.create_task(self._run_loop())
         print(f"[NotificationService] Started with {self.check_interval}s interval")
 
@@ -716,8 +791,47 @@ class NotificationService:
                 await self._task
             except asyncio.CancelledError:
                 pass
+        await self._stop_listener()
         print("[NotificationService] Stopped")
 
+    async def _start_listener(self):
+        """LISTEN for data changes so checks run as soon as something changes.
+
+        Falls back to plain interval polling if the listener can't be set up.
+        """
+        try:
+            self._listener = await asyncpg.connect(get_database_url())
+            await self._listener.add_listener(WAKEUP_CHANNEL, self._on_wakeup)
+            await self._listener.add_listener(BROADCAST_CHANNEL, self._on_broadcast)
+        except Exception as e:
+            print(f"[NotificationService] LISTEN unavailable, polling only: {e}")
+            await self._stop_listener()
+
+    async def _stop_listener(self):
+        """Close the dedicated LISTEN connection."""
+        if self._listener is None:
+            return
+        try:
+            await self._listener.close()
+        except Exception:
+            pass
+        self._listener = None
+
+    @property
+    def fanout_active(self) -> bool:
+        """Whether broadcasts can be relayed to all workers over NOTIFY."""
+        return self._listener is not None and not self._listener.is_closed()
+
+    def _on_wakeup(self, connection, pid, channel, payload):
+        """asyncpg notification callback."""
+        self._wakeup.set()
+
+    def _on_broadcast(self, connection, pid, channel, payload):
+        """Deliver a broadcast published by any worker to this worker's clients."""
+        task = asyncio.create_task(deliver_local([payload]))
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
     async def _run_loop(self):
         """Main loop that checks and sends notifications."""
         while self.running:
@@ -728,88 +842,186 @@ class NotificationService:
                 # Get pending notifications (including newly generated ones)
                 pending = await get_pending_notifications()
 
-                for notif in pending:
-                    await self._send_notification(notif)
+                if pending:
+                    await self._send_notifications(pending)
 
             except Exception as e:
                 print(f"[NotificationService] Error in loop: {e}")
 
-            await asyncio.sleep(self.check_interval)
+            # Sleep until a wakeup NOTIFY arrives, or the interval elapses
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
 
-    async def _send_notification(self, notification: Dict):
-        """Send notification through available channels."""
+    async def _send_notifications(self, notifications: List[Dict]):
+        """Send a batch of notifications through available channels."""
         try:
-            # Mark as sent
-            await mark_notification_sent(notification["id"])
-
-            # Broadcast via WebSocket to all connected clients
-            await broadcast_notification(notification)
-
+            sent_ids = set(await mark_notifications_sent([n["id"] for n in notifications]))
         except Exception as e:
-            print(f"[NotificationService] Error sending notification {notification['id']}: {e}")
+            print(f"[NotificationService] Error marking {len(notifications)} notifications sent: {e}")
+            return
+
+        # Broadcast via WebSocket to all connected clients
+        await broadcast_notifications([n for n in notifications if n["id"] in sent_ids])
 
 
 # ============================================
 # WEBSOCKET MANAGEMENT
 # ============================================
 
+class ClientChannel:
+    """Per-client outbound queue drained by a long-lived sender task.
+
+    Broadcasters only enqueue, so a slow socket never blocks the
+    notification loop or other clients.
+    """
+
+    __slots__ = ("websocket", "queue", "task")
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.task = asyncio.create_task(self._sender_loop())
+        # However the sender ends, the client must leave the registry
+        self.task.add_done_callback(self._release)
+
+    def _release(self, task: asyncio.Task):
+        if connected_clients.get(self.websocket) is self:
+            del connected_clients[self.websocket]
+
+    async def _sender_loop(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(payload), timeout=BROADCAST_SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # Dead or stalled socket
+            await self._close_socket()
+
+    def send(self, payload: str) -> bool:
+        """Enqueue a payload without blocking. Returns False if the queue is full."""
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def disconnect(self):
+        """Stop the sender task and close the socket."""
+        self.task.cancel()
+        await self._close_socket()
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+
+
 async def register_client(websocket):
     """Register a new WebSocket client."""
-    connected_clients.add(websocket)
+    channel = ClientChannel(websocket)
+    connected_clients[websocket] = channel
     print(f"[WebSocket] Client connected. Total: {len(connected_clients)}")
 
     # Send pending notifications to newly connected client
     pending = await get_user_notifications(limit=10, unread_only=True)
     for notif in pending:
-        try:
-            await websocket.send_json({
-                "type": "notification",
-                "data": serialize_notification(notif)
-            })
-        except Exception:
-            pass
+        channel.send(encode_message({
+            "type": "notification",
+            "data": notif
+        }))
 
 
 async def unregister_client(websocket):
     """Remove a WebSocket client."""
-    connected_clients.discard(websocket)
+    channel = connected_clients.pop(websocket, None)
+    if channel:
+        channel.task.cancel()
     print(f"[WebSocket] Client disconnected. Total: {len(connected_clients)}")
 
 
-async def broadcast_notification(notification: Dict):
-    """Broadcast notification to all connected WebSocket clients."""
-    if not connected_clients:
+async def broadcast_notifications(notifications: List[Dict]):
+    """
+    Broadcast notifications to every connected WebSocket client.
+
+    With the service's LISTEN connection up, payloads are relayed through
+    Postgres NOTIFY so clients attached to other uvicorn workers get them
+    too; otherwise they are delivered to this process's clients only.
+    """
+    if not notifications:
         return
 
-    message = {
-        "type": "notification",
-        "data": serialize_notification(notification)
-    }
+    # Serialize once; every queue holds the same str objects. The server runs
+    # with per-message deflate off so frames aren't recompressed per client.
+    payloads = [
+        encode_message({"type": "notification", "data": n})
+        for n in notifications
+    ]
+
+    local_only = payloads
+    if notification_service.fanout_active:
+        local_only = await _publish(payloads)
+
+    await deliver_local(local_only)
 
-    # Broadcast to all clients
-    disconnected = set()
-    for client in connected_clients:
-        try:
-            await client.send_json(message)
-        except Exception:
-            disconnected.add(client)
 
-    # Clean up disconnected clients
-    for client in disconnected:
-        connected_clients.discard(client)
+async def _publish(payloads: List[str]) -> List[str]:
+    """NOTIFY payloads to all workers. Returns those that must be delivered locally."""
+    fits, oversized = [], []
+    for payload in payloads:
+        (fits if len(payload.encode()) < NOTIFY_PAYLOAD_LIMIT else oversized).append(payload)
+    if not fits:
+        return oversized
 
+    try:
+        await db.execute(
+            "SELECT pg_notify($1, payload) FROM unnest($2::text[]) AS payload",
+            BROADCAST_CHANNEL, fits
+        )
+    except Exception as e:
+        print(f"[NotificationService] Fan-out failed, delivering locally: {e}")
+        return payloads
 
-def serialize_notification(notification: Dict) -> Dict:
-    """Serialize notification for JSON transmission."""
-    result = dict(notification)
+    # Oversized payloads can't go through NOTIFY
+    return oversized
 
-    # Convert datetime objects to ISO strings
-    for key in ["created_at", "sent_at", "read_at", "scheduled_for"]:
-        if key in result and result[key]:
-            if isinstance(result[key], datetime):
-                result[key] = result[key].isoformat()
 
-    return result
+async def deliver_local(payloads: List[str]):
+    """Queue encoded payloads for every client connected to this process."""
+    if not connected_clients or not payloads:
+        return
+
+    overflowed = []
+    for i, channel in enumerate(list(connected_clients.values()), 1):
+        for payload in payloads:
+            if not channel.send(payload):
+                overflowed.append(channel)
+                break
+        if i % BROADCAST_BATCH_SIZE == 0:
+            await asyncio.sleep(0)
+
+    # Disconnect clients that can't keep up
+    for channel in overflowed:
+        await channel.disconnect()
+
+
+async def broadcast_notification(notification: Dict):
+    """Broadcast a single notification to all connected WebSocket clients."""
+    await broadcast_notifications([notification])
+
+
+def encode_message(message: Dict) -> str:
+    """Encode a WebSocket message once with orjson, for reuse across clients.
+
+    Notification rows are passed through as-is: orjson renders their
+    datetimes natively in ISO 8601.
+    """
+    return orjson.dumps(message, default=str).decode()
 
 
 # ============================================
@@ -845,12 +1057,23 @@ CREATE TABLE IF NOT EXISTS proactive_notifications (
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Matches get_pending_notifications()'s predicate and priority ordering
 CREATE INDEX IF NOT EXISTS idx_proactive_notif_pending
-    ON proactive_notifications(sent, dismissed, scheduled_for);
+    ON proactive_notifications (
+        (CASE priority
+            WHEN 'urgent' THEN 1
+            WHEN 'high' THEN 2
+            WHEN 'normal' THEN 3
+            WHEN 'low' THEN 4
+        END),
+        created_at
+    )
+    WHERE sent = false AND dismissed = false;
 CREATE INDEX IF NOT EXISTS idx_proactive_notif_type
     ON proactive_notifications(type, created_at);
-CREATE INDEX IF NOT EXISTS idx_proactive_notif_dedup
-    ON proactive_notifications(dedup_key);
+CREATE INDEX IF NOT EXISTS idx_proactive_notif_achievement_ref
+    ON proactive_notifications(reference_type, reference_id)
+    WHERE reference_type = 'achievement';
 
 -- Notification preferences table
 CREATE TABLE IF NOT EXISTS notification_preferences (
@@ -875,8 +1098,16 @@ ON CONFLICT (notification_type) DO NOTHING;
 """
 
 
+# Set once the schema is known to exist, so repeat calls skip the check
+_schema_ready = False
+
+
 async def ensure_notification_tables():
     """Create notification tables if they don't exist."""
+    global _schema_ready
+    if _schema_ready:
+        return
+
     try:
         # Check if tables exist
         exists = await db.fetch_one("""
@@ -892,5 +1123,7 @@ async def ensure_notification_tables():
                 await conn.execute(NOTIFICATION_SCHEMA)
             print("[NotificationService] Database tables created")
 
+        _schema_ready = True
+
     except Exception as e:
         print(f"[NotificationService] Error creating tables: {e}")
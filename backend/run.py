@@ -74,7 +74,9 @@ def main():
             sys.executable, "-m", "uvicorn", "main:app", 
             "--reload", 
             "--port", str(port),
-            "--host", "127.0.0.1" 
+            "--host", "127.0.0.1",
+            # Broadcast frames are shared across clients; skip per-client deflate
+            "--ws-per-message-deflate", "false"
         ]
         
         # Run process
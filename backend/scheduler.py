@@ -4,10 +4,15 @@ Manages calendar, timetable, gap analysis, and AI-driven schedule optimization
 Includes: Daily routine, sleep management, revision scheduling, and dynamic task allocation
 """
 
+import asyncio
+from bisect import bisect_right
+from collections import defaultdict
+from operator import itemgetter
+from time import monotonic
 from datetime import datetime, date, time, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Set
 from enum import Enum
-from database import db
+from database import db, log_system
 
 
 # ============================================
@@ -118,6 +123,8 @@ KU_TIMETABLE = {
 DAY_START = time(6, 0)  # 6 AM
 DAY_END = time(23, 0)   # 11 PM
 DEEP_WORK_MIN_MINUTES = 90
+DAY_START_MINS = DAY_START.hour * 60 + DAY_START.minute
+DAY_END_MINS = DAY_END.hour * 60 + DAY_END.minute
 
 
 # ============================================
@@ -135,6 +142,12 @@ def minutes_to_time(minutes: int) -> time:
     return time(minutes // 60, minutes % 60)
 
 
+def format_minutes(minutes: int) -> str:
+    """Format minutes since midnight as HH:MM."""
+    hours, mins = divmod(minutes % (24 * 60), 60)
+    return f"{hours:02d}:{mins:02d}"
+
+
 def parse_time(time_str: str) -> time:
     """Parse time string (HH:MM) to time object."""
     parts = time_str.split(":")
@@ -146,8 +159,8 @@ def format_time(t: time) -> str:
     return t.strftime("%H:%M")
 
 
-def get_energy_level(hour: int) -> int:
-    """Get energy level (1-10) for a given hour."""
+def _interpolate_energy(hour: int) -> int:
+    """Interpolate the configured energy curve at a given hour."""
     curve = DAILY_ROUTINE_CONFIG["energy_curve"]
     times = sorted(curve.keys())
 
@@ -167,6 +180,15 @@ def get_energy_level(hour: int) -> int:
     return curve[times[-1]]
 
 
+# Energy for every hour of the day, interpolated once from the static curve
+_ENERGY_BY_HOUR = tuple(_interpolate_energy(hour) for hour in range(24))
+
+
+def get_energy_level(hour: int) -> int:
+    """Get energy level (1-10) for a given hour."""
+    return _ENERGY_BY_HOUR[hour % 24]
+
+
 # ============================================
 # TIMETABLE OPERATIONS
 # ============================================
@@ -180,10 +202,11 @@ def get_timetable_for_date(target_date: date) -> List[Dict]:
     """Get university timetable for a specific date."""
     day_name = target_date.strftime("%A")
     timetable = get_timetable_for_day(day_name)
+    date_str = str(target_date)
 
     # Add date to each entry
     return [
-        {**entry, "date": str(target_date)}
+        {**entry, "date": date_str}
         for entry in timetable
     ]
 
@@ -198,64 +221,118 @@ async def get_today_timetable() -> Dict:
         "date": str(today),
         "day": day_name,
         "classes": timetable,
-        "class_count": len(timetable),
-        "has_lab": any(c["type"] == "lab" for c in timetable)
+        **_TIMETABLE_META.get(day_name, _EMPTY_DAY_META)
+    }
+
+
+# KU_TIMETABLE is static, so each day's classes are converted to busy
+# blocks (minutes since midnight) once at import
+_TIMETABLE_BUSY = {
+    day: tuple(
+        {
+            "start": time_to_minutes(parse_time(cls["start"])),
+            "end": time_to_minutes(parse_time(cls["end"])),
+            "type": cls["type"],
+            "label": f"{cls['subject']} ({cls['type']})"
+        }
+        for cls in classes
+    )
+    for day, classes in KU_TIMETABLE.items()
+}
+
+# Day-level summary used by get_today_timetable
+_TIMETABLE_META = {
+    day: {
+        "class_count": len(blocks),
+        "has_lab": any(block["type"] == "lab" for block in blocks)
     }
+    for day, blocks in _TIMETABLE_BUSY.items()
+}
+_EMPTY_DAY_META = {"class_count": 0, "has_lab": False}
+
+# Class start minutes per day, in timetable order (classes are listed by start)
+_TIMETABLE_STARTS = {
+    day: [block["start"] for block in blocks]
+    for day, blocks in _TIMETABLE_BUSY.items()
+}
+
+
+def get_next_class(day_name: str, now: datetime) -> Optional[Dict]:
+    """Get the first class on day_name that starts after now, if any."""
+    starts = _TIMETABLE_STARTS.get(day_name)
+    if not starts:
+        return None
+    idx = bisect_right(starts, now.hour * 60 + now.minute)
+    return KU_TIMETABLE[day_name][idx] if idx < len(starts) else None
+
+
+# A day's tasks with subject info. Shared so every caller sends identical
+# SQL text and reuses asyncpg's per-connection prepared statement.
+TASKS_FOR_DAY_SQL = """
+    SELECT t.*, s.code as subject_code, s.color
+    FROM tasks t
+    LEFT JOIN subjects s ON t.subject_id = s.id
+    WHERE t.scheduled_start >= $1::date
+      AND t.scheduled_start < $1::date + 1
+    ORDER BY t.scheduled_start
+"""
 
 
 # ============================================
 # GAP ANALYSIS
 # ============================================
 
-def time_to_minutes(t: time) -> int:
-    """Convert time to minutes since midnight."""
-    return t.hour * 60 + t.minute
+# Recent gap analyses keyed by date -> (computed_at, result); cleared on task writes
+_gap_cache: Dict[date, tuple] = {}
+GAP_CACHE_TTL_SECONDS = 60
 
+# Bumped on every task write so caches outside this module can tell
+# whether the schedule changed since they were filled
+_schedule_version = 0
 
-def minutes_to_time(minutes: int) -> time:
-    """Convert minutes since midnight to time."""
-    return time(minutes // 60, minutes % 60)
 
+def invalidate_gap_cache() -> None:
+    """Drop cached gap analyses after tasks are created, moved or deleted."""
+    global _schedule_version
+    _schedule_version += 1
+    _gap_cache.clear()
 
-def parse_time(time_str: str) -> time:
-    """Parse time string (HH:MM) to time object."""
-    parts = time_str.split(":")
-    return time(int(parts[0]), int(parts[1]))
+
+def schedule_version() -> int:
+    """Counter that changes whenever the task schedule is written."""
+    return _schedule_version
 
 
-async def analyze_day_gaps(target_date: date) -> Dict:
+async def analyze_day_gaps(target_date: date, tasks: Optional[List[Dict]] = None) -> Dict:
     """
     Analyze gaps in a day's schedule for deep work opportunities.
 
+    Args:
+        target_date: Day to analyze
+        tasks: That day's task rows, if the caller already fetched them
+
     Returns:
         Dictionary with gaps, total available time, and recommendations
     """
-    day_name = target_date.strftime("%A")
+    if tasks is None:
+        cached = _gap_cache.get(target_date)
+        if cached and monotonic() - cached[0] < GAP_CACHE_TTL_SECONDS:
+            return cached[1]
 
-    # Get fixed timetable
-    timetable = get_timetable_for_day(day_name)
+    day_name = target_date.strftime("%A")
 
     # Get scheduled tasks for this day
-    tasks = await db.fetch("""
-        SELECT scheduled_start, duration_mins, title, is_deep_work
-        FROM tasks
-        WHERE DATE(scheduled_start) = $1
-        ORDER BY scheduled_start
-    """, target_date)
-
-    # Build list of busy blocks
-    busy_blocks = []
+    if tasks is None:
+        tasks = await db.fetch("""
+            SELECT scheduled_start, duration_mins, title, is_deep_work
+            FROM tasks
+            WHERE scheduled_start >= $1::date
+              AND scheduled_start < $1::date + 1
+            ORDER BY scheduled_start
+        """, target_date)
 
-    # Add timetable classes
-    for cls in timetable:
-        start_mins = time_to_minutes(parse_time(cls["start"]))
-        end_mins = time_to_minutes(parse_time(cls["end"]))
-        busy_blocks.append({
-            "start": start_mins,
-            "end": end_mins,
-            "type": cls["type"],
-            "label": f"{cls['subject']} ({cls['type']})"
-        })
+    # Build list of busy blocks, starting from the precomputed timetable classes
+    busy_blocks = list(_TIMETABLE_BUSY.get(day_name, ()))
 
     # Add scheduled tasks
     for task in tasks:
@@ -271,65 +348,89 @@ async def analyze_day_gaps(target_date: date) -> Dict:
             })
 
     # Sort by start time
-    busy_blocks.sort(key=lambda x: x["start"])
+    busy_blocks.sort(key=itemgetter("start"))
 
-    # Find gaps
+    # Find gaps in one integer pass, accumulating totals as we go
     gaps = []
-    day_start_mins = time_to_minutes(DAY_START)
-    day_end_mins = time_to_minutes(DAY_END)
-
-    current_time = day_start_mins
-
-    for block in busy_blocks:
-        if block["start"] > current_time:
-            gap_duration = block["start"] - current_time
+    total_gap_mins = 0
+    deep_work_mins = 0
+    deep_work_blocks = 0
+
+    current_time = DAY_START_MINS
+    block_starts = [block["start"] for block in busy_blocks]
+    block_ends = [block["end"] for block in busy_blocks]
+
+    for gap_end, block_end in zip(block_starts + [DAY_END_MINS], block_ends + [DAY_END_MINS]):
+        if gap_end > current_time:
+            gap_duration = gap_end - current_time
+            suitable = gap_duration >= DEEP_WORK_MIN_MINUTES
             gaps.append({
-                "start": minutes_to_time(current_time).strftime("%H:%M"),
-                "end": minutes_to_time(block["start"]).strftime("%H:%M"),
+                "start": format_minutes(current_time),
+                "start_mins": current_time,
+                "end": format_minutes(gap_end),
                 "duration_mins": gap_duration,
-                "is_deep_work_suitable": gap_duration >= DEEP_WORK_MIN_MINUTES
+                "is_deep_work_suitable": suitable
             })
-        current_time = max(current_time, block["end"])
-
-    # Check for gap after last block until day end
-    if current_time < day_end_mins:
-        gap_duration = day_end_mins - current_time
-        gaps.append({
-            "start": minutes_to_time(current_time).strftime("%H:%M"),
-            "end": minutes_to_time(day_end_mins).strftime("%H:%M"),
-            "duration_mins": gap_duration,
-            "is_deep_work_suitable": gap_duration >= DEEP_WORK_MIN_MINUTES
-        })
-
-    # Calculate totals
-    total_gap_mins = sum(g["duration_mins"] for g in gaps)
-    deep_work_mins = sum(g["duration_mins"] for g in gaps if g["is_deep_work_suitable"])
-
-    return {
+            total_gap_mins += gap_duration
+            if suitable:
+                deep_work_mins += gap_duration
+                deep_work_blocks += 1
+        if block_end > current_time:
+            current_time = block_end
+
+    analysis = {
         "date": str(target_date),
         "day": day_name,
         "gaps": gaps,
         "total_gaps": len(gaps),
         "total_available_mins": total_gap_mins,
         "deep_work_available_mins": deep_work_mins,
-        "deep_work_blocks": len([g for g in gaps if g["is_deep_work_suitable"]]),
+        "deep_work_blocks": deep_work_blocks,
         "busy_blocks": busy_blocks
     }
+    _gap_cache[target_date] = (monotonic(), analysis)
+    return analysis
+
+
+async def analyze_gaps_for_range(start_date: date, days: int) -> List[Dict]:
+    """
+    Run gap analysis for each of `days` consecutive days from start_date.
+
+    The whole range's tasks are loaded in one query and handed to
+    analyze_day_gaps per day, instead of one tasks query per day.
+    """
+    if days < 1:
+        return []
+
+    rows = await db.fetch("""
+        SELECT scheduled_start, duration_mins, title, is_deep_work,
+               DATE(scheduled_start) as scheduled_date
+        FROM tasks
+        WHERE scheduled_start >= $1::date
+          AND scheduled_start < $1::date + $2::int
+        ORDER BY scheduled_start
+    """, start_date, days)
+
+    tasks_by_day = defaultdict(list)
+    for row in rows:
+        tasks_by_day[row.pop("scheduled_date")].append(row)
+
+    analyses = []
+    for i in range(days):
+        target_date = start_date + timedelta(days=i)
+        analyses.append(await analyze_day_gaps(target_date, tasks_by_day[target_date]))
+    return analyses
 
 
 async def find_deep_work_slots(days: int = 7) -> List[Dict]:
     """Find deep work opportunities over the next N days."""
     slots = []
-    today = date.today()
-
-    for i in range(days):
-        target_date = today + timedelta(days=i)
-        analysis = await analyze_day_gaps(target_date)
 
+    for analysis in await analyze_gaps_for_range(date.today(), days):
         for gap in analysis["gaps"]:
             if gap["is_deep_work_suitable"]:
                 slots.append({
-                    "date": str(target_date),
+                    "date": analysis["date"],
                     "day": analysis["day"],
                     **gap
                 })
@@ -346,6 +447,23 @@ async def get_week_schedule(start_date: Optional[date] = None) -> Dict:
     if not start_date:
         start_date = date.today()
 
+    end_date = start_date + timedelta(days=6)
+
+    # Get the whole week's tasks in one query, then bucket them by day
+    rows = await db.fetch("""
+        SELECT t.*, s.code as subject_code, s.color,
+               DATE(t.scheduled_start) as scheduled_date
+        FROM tasks t
+        LEFT JOIN subjects s ON t.subject_id = s.id
+        WHERE t.scheduled_start >= $1::date
+          AND t.scheduled_start < $2::date + 1
+        ORDER BY t.scheduled_start
+    """, start_date, end_date)
+
+    tasks_by_day = defaultdict(list)
+    for row in rows:
+        tasks_by_day[row.pop("scheduled_date")].append(row)
+
     week = []
     for i in range(7):
         current_date = start_date + timedelta(days=i)
@@ -354,17 +472,10 @@ async def get_week_schedule(start_date: Optional[date] = None) -> Dict:
         # Get timetable
         timetable = get_timetable_for_day(day_name)
 
-        # Get tasks
-        tasks = await db.fetch("""
-            SELECT t.*, s.code as subject_code, s.color
-            FROM tasks t
-            LEFT JOIN subjects s ON t.subject_id = s.id
-            WHERE DATE(t.scheduled_start) = $1
-            ORDER BY t.scheduled_start
-        """, current_date)
+        tasks = tasks_by_day[current_date]
 
         # Analyze gaps
-        gap_analysis = await analyze_day_gaps(current_date)
+        gap_analysis = await analyze_day_gaps(current_date, tasks)
 
         week.append({
             "date": str(current_date),
@@ -420,25 +531,20 @@ async def redistribute_schedule(
 
     # Find available slots between now and event
     available_slots = []
-    for i in range(days_until):
-        target_date = today + timedelta(days=i)
-        analysis = await analyze_day_gaps(target_date)
-
+    for analysis in await analyze_gaps_for_range(today, days_until):
         for gap in analysis["gaps"]:
             if gap["duration_mins"] >= 30:  # Minimum useful block
                 available_slots.append({
-                    "date": str(target_date),
+                    "date": analysis["date"],
                     "day": analysis["day"],
                     **gap
                 })
 
-    # Sort by suitability (prefer deep work slots closer to event)
-    available_slots.sort(
-        key=lambda s: (
-            not s["is_deep_work_suitable"],  # Deep work first
-            -datetime.strptime(s["date"], "%Y-%m-%d").timestamp()  # Later dates first
-        )
-    )
+    # Sort by suitability (prefer deep work slots closer to event).
+    # ISO date strings sort chronologically, and sort() is stable, so two
+    # passes give deep work first with later dates first within each group.
+    available_slots.sort(key=itemgetter("date"), reverse=True)
+    available_slots.sort(key=lambda s: not s["is_deep_work_suitable"])
 
     # Allocate study blocks
     allocated = []
@@ -481,36 +587,41 @@ async def redistribute_schedule(
 
 async def apply_redistribution(blocks: List[Dict]) -> Dict:
     """Apply the redistribution plan by creating tasks."""
-    created = []
-
-    for block in blocks:
-        # Parse date and time
-        block_date = datetime.strptime(block["date"], "%Y-%m-%d").date()
-        start_time = parse_time(block["start"])
-        scheduled_start = datetime.combine(block_date, start_time)
-
-        # Get subject ID
-        subject = await db.fetch_one(
-            "SELECT id FROM subjects WHERE code = $1",
-            block["subject"]
-        )
+    if not blocks:
+        return {"success": True, "tasks_created": 0, "tasks": []}
+
+    # Resolve every subject code in one lookup
+    codes = list({block["subject"] for block in blocks})
+    subject_rows = await db.fetch(
+        "SELECT id, code FROM subjects WHERE code = ANY($1::text[])",
+        codes
+    )
+    subject_ids = {row["code"]: row["id"] for row in subject_rows}
 
-        task = await db.execute_returning("""
-            INSERT INTO tasks (
-                title, subject_id, scheduled_start, duration_mins,
-                priority, is_deep_work, task_type
-            ) VALUES ($1, $2, $3, $4, $5, $6, 'study')
-            RETURNING *
-        """,
-            block["title"],
-            subject["id"] if subject else None,
-            scheduled_start,
-            block["duration_mins"],
-            8,  # High priority for event prep
-            block.get("is_deep_work", False)
+    # Insert the whole plan in a single statement
+    created = await db.fetch("""
+        INSERT INTO tasks (
+            title, subject_id, scheduled_start, duration_mins,
+            priority, is_deep_work, task_type
         )
+        -- Priority 8: high priority for event prep
+        SELECT title, subject_id, scheduled_start, duration_mins, 8, is_deep_work, 'study'
+        FROM unnest($1::text[], $2::int[], $3::timestamptz[], $4::int[], $5::bool[])
+            WITH ORDINALITY AS b(title, subject_id, scheduled_start, duration_mins, is_deep_work, ord)
+        ORDER BY ord
+        RETURNING *
+    """,
+        [block["title"] for block in blocks],
+        [subject_ids.get(block["subject"]) for block in blocks],
+        [
+            datetime.combine(date.fromisoformat(block["date"]), parse_time(block["start"]))
+            for block in blocks
+        ],
+        [block["duration_mins"] for block in blocks],
+        [block.get("is_deep_work", False) for block in blocks]
+    )
 
-        created.append(task)
+    invalidate_gap_cache()
 
     return {
         "success": True,
@@ -523,32 +634,31 @@ async def apply_redistribution(blocks: List[Dict]) -> Dict:
 # LAB REPORT TRACKING
 # ============================================
 
+# Lab report urgency labels that need attention now
+URGENT_LAB_URGENCIES = frozenset(("overdue", "urgent"))
+
+
 async def get_lab_report_countdown() -> List[Dict]:
     """Get pending lab reports with countdown."""
-    reports = await db.fetch("""
+    return await db.fetch("""
         SELECT
             lr.*,
             s.code as subject_code,
             s.name as subject_name,
             s.color,
-            lr.due_date - CURRENT_DATE as days_remaining
+            lr.due_date - CURRENT_DATE as days_remaining,
+            CASE
+                WHEN lr.due_date < CURRENT_DATE THEN 'overdue'
+                WHEN lr.due_date - CURRENT_DATE <= 2 THEN 'urgent'
+                WHEN lr.due_date - CURRENT_DATE <= 7 THEN 'soon'
+                ELSE 'normal'
+            END as urgency
         FROM lab_reports lr
         JOIN subjects s ON lr.subject_id = s.id
         WHERE lr.status != 'submitted'
         ORDER BY lr.due_date ASC
     """)
 
-    return [
-        {
-            **report,
-            "urgency": "overdue" if report["days_remaining"] < 0
-                else "urgent" if report["days_remaining"] <= 2
-                else "soon" if report["days_remaining"] <= 7
-                else "normal"
-        }
-        for report in reports
-    ]
-
 
 async def create_lab_report_entry(
     subject_code: str,
@@ -610,103 +720,108 @@ async def get_upcoming_deadlines(days: int = 7) -> List[Dict]:
     """Get all upcoming deadlines in the next N days."""
     cutoff = date.today() + timedelta(days=days)
 
-    # Get lab reports
-    reports = await db.fetch("""
-        SELECT
-            'lab_report' as type,
-            lr.experiment_name as title,
-            s.code as subject_code,
-            s.color,
-            lr.due_date,
-            lr.due_date - CURRENT_DATE as days_remaining
-        FROM lab_reports lr
-        JOIN subjects s ON lr.subject_id = s.id
-        WHERE lr.status != 'submitted'
-          AND lr.due_date <= $1
-        ORDER BY lr.due_date
-    """, cutoff)
-
-    # Get scheduled assignments
-    assignments = await db.fetch("""
-        SELECT
-            'assignment' as type,
-            t.title,
-            s.code as subject_code,
-            s.color,
-            DATE(t.scheduled_start) as due_date,
-            DATE(t.scheduled_start) - CURRENT_DATE as days_remaining
-        FROM tasks t
-        LEFT JOIN subjects s ON t.subject_id = s.id
-        WHERE t.task_type = 'assignment'
-          AND t.status != 'completed'
-          AND DATE(t.scheduled_start) <= $1
-        ORDER BY t.scheduled_start
-    """, cutoff)
-
-    # Get goals with deadlines
-    goals = await db.fetch("""
-        SELECT
-            'goal' as type,
-            sg.title,
-            s.code as subject_code,
-            s.color,
-            sg.deadline as due_date,
-            sg.deadline - CURRENT_DATE as days_remaining
-        FROM study_goals sg
-        LEFT JOIN subjects s ON sg.subject_id = s.id
-        WHERE sg.completed = false
-          AND sg.deadline IS NOT NULL
-          AND sg.deadline <= $1
-        ORDER BY sg.deadline
+    # Lab reports, scheduled assignments and goals in one round-trip,
+    # ordered by due date (sources keep that order on ties)
+    return await db.fetch("""
+        SELECT type, title, subject_code, color, due_date, days_remaining
+        FROM (
+            SELECT
+                'lab_report' as type,
+                lr.experiment_name as title,
+                s.code as subject_code,
+                s.color,
+                lr.due_date,
+                lr.due_date - CURRENT_DATE as days_remaining,
+                1 as source_rank
+            FROM lab_reports lr
+            JOIN subjects s ON lr.subject_id = s.id
+            WHERE lr.status != 'submitted'
+              AND lr.due_date <= $1
+
+            UNION ALL
+
+            SELECT
+                'assignment' as type,
+                t.title,
+                s.code as subject_code,
+                s.color,
+                DATE(t.scheduled_start) as due_date,
+                DATE(t.scheduled_start) - CURRENT_DATE as days_remaining,
+                2 as source_rank
+            FROM tasks t
+            LEFT JOIN subjects s ON t.subject_id = s.id
+            WHERE t.task_type = 'assignment'
+              AND t.status != 'completed'
+              AND t.scheduled_start < $1::date + 1
+
+            UNION ALL
+
+            SELECT
+                'goal' as type,
+                sg.title,
+                s.code as subject_code,
+                s.color,
+                sg.deadline as due_date,
+                sg.deadline - CURRENT_DATE as days_remaining,
+                3 as source_rank
+            FROM study_goals sg
+            LEFT JOIN subjects s ON sg.subject_id = s.id
+            WHERE sg.completed = false
+              AND sg.deadline IS NOT NULL
+              AND sg.deadline <= $1
+        ) deadlines
+        ORDER BY due_date NULLS LAST, source_rank
     """, cutoff)
 
-    # Combine and sort by date
-    all_deadlines = list(reports) + list(assignments) + list(goals)
-    all_deadlines.sort(key=lambda x: x["due_date"] or date.max)
 
-    return all_deadlines
+# Days-before-deadline at which a countdown reminder is created
+DEADLINE_COUNTDOWN_PREFIXES = {
+    7: "1 week until",
+    3: "3 days until",
+    1: "Tomorrow:",
+    0: "TODAY:",
+}
 
 
 async def schedule_notifications_for_deadlines() -> Dict:
     """Auto-schedule notifications for upcoming deadlines."""
-    deadlines = await get_upcoming_deadlines(14)  # 2 weeks out
+    from notifications import make_dedup_key
 
-    notifications_created = 0
+    deadlines = await get_upcoming_deadlines(14)  # 2 weeks out
 
+    # Build every candidate reminder first, then insert them in one statement
+    titles, messages, priorities, reference_types, dedup_keys = [], [], [], [], []
     for deadline in deadlines:
         days = deadline["days_remaining"]
+        prefix = DEADLINE_COUNTDOWN_PREFIXES.get(days)
+        if prefix is None:
+            continue
 
-        # Create notifications at key intervals
-        notification_days = []
-        if days == 7:
-            notification_days.append((7, "1 week until"))
-        if days == 3:
-            notification_days.append((3, "3 days until"))
-        if days == 1:
-            notification_days.append((1, "Tomorrow:"))
-        if days == 0:
-            notification_days.append((0, "TODAY:"))
-
-        for day_offset, prefix in notification_days:
-            # Check if notification already exists
-            existing = await db.fetch_one("""
-                SELECT id FROM notifications
-                WHERE reference_type = $1
-                  AND reference_id = $2
-                  AND DATE(due_at) = $3
-            """, deadline["type"], deadline.get("id"), deadline["due_date"])
-
-            if not existing:
-                await db.execute("""
-                    INSERT INTO notifications (type, title, message, due_at)
-                    VALUES ($1, $2, $3, $4)
-                """,
-                    "due_date",
-                    f"{prefix} {deadline['title']}",
-                    f"{deadline['type'].replace('_', ' ').title()} for {deadline.get('subject_code', 'General')}",
-                    deadline["due_date"]
-                )
-                notifications_created += 1
+        titles.append(f"{prefix} {deadline['title']}")
+        messages.append(
+            f"{deadline['type'].replace('_', ' ').title()} for {deadline.get('subject_code') or 'General'}"
+        )
+        priorities.append("high" if days <= 1 else "normal")
+        reference_types.append(deadline["type"])
+        dedup_keys.append(make_dedup_key(
+            "deadline_countdown", deadline["type"], deadline["title"], deadline["due_date"], days
+        ))
+
+    notifications_created = 0
+    if dedup_keys:
+        created = await db.fetch("""
+            INSERT INTO proactive_notifications (
+                type, title, message, priority,
+                action_url, action_label, reference_type, dedup_key
+            )
+            SELECT 'reminder', title, message, priority,
+                   '/schedule', 'View Schedule', reference_type, dedup_key
+            FROM unnest($1::text[], $2::text[], $3::text[], $4::text[], $5::text[])
+                AS c(title, message, priority, reference_type, dedup_key)
+            ON CONFLICT (dedup_key) DO NOTHING
+            RETURNING id
+        """, titles, messages, priorities, reference_types, dedup_keys)
+        notifications_created = len(created)
 
     return {
         "success": True,
@@ -721,70 +836,59 @@ async def schedule_notifications_for_deadlines() -> Dict:
 
 async def get_today_at_glance() -> Dict:
     """Get comprehensive view of today's schedule and priorities."""
-    today = date.today()
+    # Read the clock once; today and the next-class cutoff both derive from it
+    now = datetime.now()
+    today = now.date()
     day_name = today.strftime("%A")
 
     # Get timetable
     timetable = get_timetable_for_day(day_name)
 
-    # Get today's tasks
-    tasks = await db.fetch("""
-        SELECT t.*, s.code as subject_code, s.color
-        FROM tasks t
-        LEFT JOIN subjects s ON t.subject_id = s.id
-        WHERE DATE(t.scheduled_start) = $1
-        ORDER BY t.scheduled_start
-    """, today)
-
-    # Get gap analysis
-    gaps = await analyze_day_gaps(today)
-
-    # Get pending lab reports
-    lab_reports = await get_lab_report_countdown()
-    urgent_reports = [r for r in lab_reports if r["urgency"] in ("overdue", "urgent")]
-
-    # Get upcoming deadlines (next 3 days)
-    deadlines = await get_upcoming_deadlines(3)
-
-    # Get active timer if any
-    active_timer = await db.fetch_one("""
-        SELECT at.*, s.code as subject_code
-        FROM active_timer at
-        LEFT JOIN subjects s ON at.subject_id = s.id
-        WHERE at.id = 1
-    """)
-
-    # Get study stats for today
-    today_stats = await db.fetch_one("""
-        SELECT
-            COALESCE(SUM(duration_seconds), 0) as total_seconds,
-            COUNT(*) as session_count,
-            SUM(CASE WHEN is_deep_work THEN 1 ELSE 0 END) as deep_work_count
-        FROM study_sessions
-        WHERE DATE(started_at) = $1
-          AND stopped_at IS NOT NULL
-    """, today)
-
-    # Get current streak
-    streak = await db.fetch_one(
-        "SELECT current_streak, total_points FROM user_streaks WHERE id = 1"
+    # None of these depend on each other, so run them concurrently
+    tasks, gaps, lab_reports, deadlines, active_timer, today_stats, streak = await asyncio.gather(
+        # Today's tasks
+        db.fetch(TASKS_FOR_DAY_SQL, today),
+        analyze_day_gaps(today),
+        get_lab_report_countdown(),
+        # Upcoming deadlines (next 3 days)
+        get_upcoming_deadlines(3),
+        # Active timer if any
+        db.fetch_one("""
+            SELECT at.*, s.code as subject_code
+            FROM active_timer at
+            LEFT JOIN subjects s ON at.subject_id = s.id
+            WHERE at.id = 1
+        """),
+        # Study stats for today
+        db.fetch_one("""
+            SELECT
+                COALESCE(SUM(duration_seconds), 0) as total_seconds,
+                COUNT(*) as session_count,
+                SUM(CASE WHEN is_deep_work THEN 1 ELSE 0 END) as deep_work_count
+            FROM study_sessions
+            WHERE DATE(started_at) = $1
+              AND stopped_at IS NOT NULL
+        """, today),
+        # Current streak
+        db.fetch_one(
+            "SELECT current_streak, total_points FROM user_streaks WHERE id = 1"
+        )
     )
 
+    urgent_reports = [r for r in lab_reports if r["urgency"] in URGENT_LAB_URGENCIES]
+
     return {
         "date": str(today),
         "day": day_name,
         "timetable": {
             "classes": timetable,
             "class_count": len(timetable),
-            "next_class": next(
-                (c for c in timetable if parse_time(c["start"]) > datetime.now().time()),
-                None
-            )
+            "next_class": get_next_class(day_name, now)
         },
         "tasks": {
             "scheduled": tasks,
             "count": len(tasks),
-            "completed": len([t for t in tasks if t["status"] == "completed"])
+            "completed": sum(1 for t in tasks if t["status"] == "completed")
         },
         "gaps": {
             "total_available_mins": gaps["total_available_mins"],
@@ -859,6 +963,16 @@ async def get_user_schedule_config() -> Dict:
     return config
 
 
+# Timeline activity for each task_type; anything else is shown as study
+_TASK_TYPE_TO_ACTIVITY = {
+    "study": ActivityType.STUDY,
+    "revision": ActivityType.REVISION,
+    "practice": ActivityType.PRACTICE,
+    "assignment": ActivityType.ASSIGNMENT,
+    "lab_work": ActivityType.LAB_WORK,
+}
+
+
 async def generate_optimized_timeline(target_date: date) -> Dict:
     """
     Generate a fully optimized timeline for a specific day.
@@ -879,6 +993,7 @@ async def generate_optimized_timeline(target_date: date) -> Dict:
     timeline.append({
         "type": ActivityType.SLEEP,
         "start": config["sleep_start"],
+        "start_mins": time_to_minutes(parse_time(config["sleep_start"])),
         "end": config["sleep_end"],
         "duration_mins": 7 * 60,  # Approx
         "label": "Sleep",
@@ -890,7 +1005,8 @@ async def generate_optimized_timeline(target_date: date) -> Dict:
     timeline.append({
         "type": ActivityType.WAKE_ROUTINE,
         "start": config["sleep_end"],
-        "end": minutes_to_time(wake_routine_end_mins).strftime("%H:%M"),
+        "start_mins": time_to_minutes(sleep_end),
+        "end": format_minutes(wake_routine_end_mins),
         "duration_mins": config["wake_routine_mins"],
         "label": "Morning Routine",
         "fixed": True,
@@ -902,8 +1018,9 @@ async def generate_optimized_timeline(target_date: date) -> Dict:
     breakfast_end = breakfast_start + config["breakfast_mins"]
     timeline.append({
         "type": ActivityType.BREAKFAST,
-        "start": minutes_to_time(breakfast_start).strftime("%H:%M"),
-        "end": minutes_to_time(breakfast_end).strftime("%H:%M"),
+        "start": format_minutes(breakfast_start),
+        "start_mins": breakfast_start,
+        "end": format_minutes(breakfast_end),
         "duration_mins": config["breakfast_mins"],
         "label": "Breakfast",
         "fixed": True,
@@ -918,6 +1035,7 @@ async def generate_optimized_timeline(target_date: date) -> Dict:
         timeline.append({
             "type": ActivityType.UNIVERSITY,
             "start": cls["start"],
+            "start_mins": start_mins,
             "end": cls["end"],
             "duration_mins": end_mins - start_mins,
             "label": f"{cls['subject']} ({cls['type']})",
@@ -933,7 +1051,8 @@ async def generate_optimized_timeline(target_date: date) -> Dict:
     timeline.append({
         "type": ActivityType.LUNCH,
         "start": lunch_time,
-        "end": minutes_to_time(lunch_mins + config["lunch_mins"]).strftime("%H:%M"),
+        "start_mins": lunch_mins,
+        "end": format_minutes(lunch_mins + config["lunch_mins"]),
         "duration_mins": config["lunch_mins"],
         "label": "Lunch",
         "fixed": True,
@@ -946,7 +1065,8 @@ async def generate_optimized_timeline(target_date: date) -> Dict:
     timeline.append({
         "type": ActivityType.DINNER,
         "start": dinner_time,
-        "end": minutes_to_time(dinner_mins + config["dinner_mins"]).strftime("%H:%M"),
+        "start_mins": dinner_mins,
+        "end": format_minutes(dinner_mins + config["dinner_mins"]),
         "duration_mins": config["dinner_mins"],
         "label": "Dinner",
         "fixed": True,
@@ -954,13 +1074,7 @@ async def generate_optimized_timeline(target_date: date) -> Dict:
     })
 
     # 7. Add scheduled tasks
-    tasks = await db.fetch("""
-        SELECT t.*, s.code as subject_code, s.color
-        FROM tasks t
-        LEFT JOIN subjects s ON t.subject_id = s.id
-        WHERE DATE(t.scheduled_start) = $1
-        ORDER BY t.scheduled_start
-    """, target_date)
+    tasks = await db.fetch(TASKS_FOR_DAY_SQL, target_date)
 
     for task in tasks:
         if task["scheduled_start"]:
@@ -969,19 +1083,13 @@ async def generate_optimized_timeline(target_date: date) -> Dict:
             duration = task["duration_mins"] or 60
 
             # Determine activity type from task
-            task_type = task.get("task_type", "study")
-            activity_type = {
-                "study": ActivityType.STUDY,
-                "revision": ActivityType.REVISION,
-                "practice": ActivityType.PRACTICE,
-                "assignment": ActivityType.ASSIGNMENT,
-                "lab_work": ActivityType.LAB_WORK,
-            }.get(task_type, ActivityType.STUDY)
+            activity_type = _TASK_TYPE_TO_ACTIVITY.get(task.get("task_type"), ActivityType.STUDY)
 
             timeline.append({
                 "type": activity_type,
-                "start": minutes_to_time(start_mins).strftime("%H:%M"),
-                "end": minutes_to_time(start_mins + duration).strftime("%H:%M"),
+                "start": format_minutes(start_mins),
+                "start_mins": start_mins,
+                "end": format_minutes(start_mins + duration),
                 "duration_mins": duration,
                 "label": task["title"],
                 "task_id": task["id"],
@@ -992,10 +1100,7 @@ async def generate_optimized_timeline(target_date: date) -> Dict:
             })
 
     # Sort timeline by start time
-    def sort_key(block):
-        return time_to_minutes(parse_time(block["start"]))
-
-    timeline.sort(key=sort_key)
+    timeline.sort(key=itemgetter("start_mins"))
 
     # 8. Calculate gaps and suggest optimal activities
     gaps = await analyze_day_gaps(target_date)
@@ -1014,128 +1119,163 @@ async def generate_optimized_timeline(target_date: date) -> Dict:
     }
 
 
-async def get_pending_work_items(days_ahead: int = 14) -> List[Dict]:
-    """
-    Get all pending work items that need to be scheduled.
-    Includes: revisions, assignments, lab reports, goals with deadlines.
-    """
-    cutoff = date.today() + timedelta(days=days_ahead)
+# Columns each pending item type exposes from the combined pending-work query
+PENDING_ITEM_FIELDS = {
+    "revision": (
+        "id", "chapter_id", "revision_number", "due_date", "chapter_title",
+        "chapter_number", "subject_code", "credits", "color", "item_type", "days_until"
+    ),
+    "lab_report": (
+        "id", "experiment_name", "due_date", "status",
+        "subject_code", "credits", "color", "item_type", "days_until"
+    ),
+    "goal": (
+        "id", "title", "deadline", "priority", "target_value", "current_value", "unit",
+        "subject_code", "color", "item_type", "days_until"
+    ),
+    "task": (
+        "id", "title", "task_type", "priority", "scheduled_start", "duration_mins",
+        "subject_code", "color", "item_type", "days_until"
+    ),
+}
 
-    # Pending revisions (spaced repetition)
-    revisions = await db.fetch("""
+# Revisions, lab reports, goals and tasks in one round trip. Each arm fills
+# the shared column list, NULL-padding what it doesn't have, and computes
+# its own priority and time estimate; PENDING_ITEM_FIELDS trims every row
+# back to its own columns. The TaskPriority weights are formatted in once
+# here, so the statement text stays constant.
+PENDING_WORK_SQL = """
+    SELECT *, COUNT(*) OVER () as total_count FROM (
+        -- Pending revisions (spaced repetition), typically 30 mins
         SELECT
-            rs.id, rs.chapter_id, rs.revision_number, rs.due_date,
-            c.title as chapter_title, c.number as chapter_number,
+            1 as arm, rs.due_date::timestamptz as sort_at,
+            rs.id, 'revision' as item_type,
             s.code as subject_code, s.credits, s.color,
-            'revision' as item_type,
-            rs.due_date - CURRENT_DATE as days_until
+            rs.due_date - CURRENT_DATE as days_until,
+            rs.chapter_id, rs.revision_number, rs.due_date,
+            c.title as chapter_title, c.number as chapter_number,
+            NULL::varchar as experiment_name, NULL::text as status,
+            NULL::varchar as title, NULL::date as deadline, NULL::int as priority,
+            NULL::int as target_value, NULL::int as current_value, NULL::varchar as unit,
+            NULL::varchar as task_type, NULL::timestamptz as scheduled_start,
+            NULL::int as duration_mins,
+            CASE WHEN rs.due_date - CURRENT_DATE <= 1
+                 THEN {p.REVISION_DUE} ELSE {p.REVISION_UPCOMING}
+            END + s.credits * 5 as computed_priority,
+            30 as estimated_mins
         FROM revision_schedule rs
         JOIN chapters c ON rs.chapter_id = c.id
         JOIN subjects s ON c.subject_id = s.id
         WHERE rs.completed = false
           AND rs.due_date <= $1
-        ORDER BY rs.due_date ASC
-    """, cutoff)
 
-    # Pending lab reports
-    labs = await db.fetch("""
+        UNION ALL
+
+        -- Pending lab reports, ~2 hours each
         SELECT
-            lr.id, lr.experiment_name, lr.due_date, lr.status,
-            s.code as subject_code, s.credits, s.color,
-            'lab_report' as item_type,
-            lr.due_date - CURRENT_DATE as days_until
+            2, lr.due_date::timestamptz,
+            lr.id, 'lab_report',
+            s.code, s.credits, s.color,
+            lr.due_date - CURRENT_DATE,
+            NULL, NULL, lr.due_date,
+            NULL, NULL,
+            lr.experiment_name, lr.status::text,
+            NULL, NULL, NULL,
+            NULL, NULL, NULL,
+            NULL, NULL,
+            NULL,
+            CASE
+                WHEN lr.due_date < CURRENT_DATE THEN {p.OVERDUE}
+                WHEN lr.due_date = CURRENT_DATE THEN {p.DUE_TODAY}
+                WHEN lr.due_date - CURRENT_DATE <= 2 THEN {p.URGENT_LAB}
+                ELSE {p.LAB_WORK}
+            END,
+            120
         FROM lab_reports lr
         JOIN subjects s ON lr.subject_id = s.id
         WHERE lr.status != 'submitted'
           AND lr.due_date <= $1
-        ORDER BY lr.due_date ASC
-    """, cutoff)
 
-    # Goals with deadlines
-    goals = await db.fetch("""
+        UNION ALL
+
+        -- Goals with deadlines, estimated at 1 hour
         SELECT
-            sg.id, sg.title, sg.deadline, sg.priority,
+            3, sg.deadline::timestamptz,
+            sg.id, 'goal',
+            s.code, NULL, s.color,
+            sg.deadline - CURRENT_DATE,
+            NULL, NULL, NULL,
+            NULL, NULL,
+            NULL, NULL,
+            sg.title, sg.deadline, sg.priority,
             sg.target_value, sg.current_value, sg.unit,
-            s.code as subject_code, s.color,
-            'goal' as item_type,
-            sg.deadline - CURRENT_DATE as days_until
+            NULL, NULL,
+            NULL,
+            CASE WHEN sg.deadline - CURRENT_DATE <= 1
+                 THEN {p.DUE_TODAY} ELSE {p.ASSIGNMENT}
+            END,
+            60
         FROM study_goals sg
         LEFT JOIN subjects s ON sg.subject_id = s.id
         WHERE sg.completed = false
           AND sg.deadline IS NOT NULL
           AND sg.deadline <= $1
-        ORDER BY sg.deadline ASC
-    """, cutoff)
 
-    # Pending tasks
-    tasks = await db.fetch("""
+        UNION ALL
+
+        -- Pending tasks
         SELECT
-            t.id, t.title, t.task_type, t.priority,
-            t.scheduled_start, t.duration_mins,
-            s.code as subject_code, s.color,
-            'task' as item_type,
-            DATE(t.scheduled_start) - CURRENT_DATE as days_until
+            4, t.scheduled_start,
+            t.id, 'task',
+            s.code, NULL, s.color,
+            DATE(t.scheduled_start) - CURRENT_DATE,
+            NULL, NULL, NULL,
+            NULL, NULL,
+            NULL, NULL,
+            t.title, NULL, t.priority,
+            NULL, NULL, NULL,
+            t.task_type, t.scheduled_start,
+            t.duration_mins,
+            CASE
+                WHEN DATE(t.scheduled_start) < CURRENT_DATE THEN {p.OVERDUE}
+                WHEN DATE(t.scheduled_start) = CURRENT_DATE THEN {p.DUE_TODAY}
+                ELSE {p.REGULAR_STUDY}
+            END + COALESCE(t.priority, 5),
+            COALESCE(NULLIF(t.duration_mins, 0), 60)
         FROM tasks t
         LEFT JOIN subjects s ON t.subject_id = s.id
         WHERE t.status NOT IN ('completed', 'cancelled')
-          AND DATE(t.scheduled_start) <= $1
-        ORDER BY t.scheduled_start ASC
-    """, cutoff)
+          AND t.scheduled_start < $1::date + 1
+    ) items
+    ORDER BY computed_priority DESC, arm, sort_at ASC
+    LIMIT $2
+""".format(p=TaskPriority)
 
-    # Combine and prioritize
-    all_items = []
-
-    for rev in revisions:
-        priority = TaskPriority.REVISION_DUE if rev["days_until"] <= 1 else TaskPriority.REVISION_UPCOMING
-        all_items.append({
-            **dict(rev),
-            "computed_priority": priority + (rev["credits"] * 5),
-            "estimated_mins": 30  # Revisions are typically 30 mins
-        })
-
-    for lab in labs:
-        days = lab["days_until"] or 0
-        if days < 0:
-            priority = TaskPriority.OVERDUE
-        elif days == 0:
-            priority = TaskPriority.DUE_TODAY
-        elif days <= 2:
-            priority = TaskPriority.URGENT_LAB
-        else:
-            priority = TaskPriority.LAB_WORK
-        all_items.append({
-            **dict(lab),
-            "computed_priority": priority,
-            "estimated_mins": 120  # Lab reports take ~2 hours
-        })
 
-    for goal in goals:
-        days = goal["days_until"] or 0
-        priority = TaskPriority.DUE_TODAY if days <= 1 else TaskPriority.ASSIGNMENT
-        all_items.append({
-            **dict(goal),
-            "computed_priority": priority,
-            "estimated_mins": 60  # Variable, estimate 1 hour
-        })
+async def _pending_work_page(days_ahead: int, limit: Optional[int]) -> tuple:
+    """Top pending work items plus how many there are in total."""
+    cutoff = date.today() + timedelta(days=days_ahead)
+    rows = await db.fetch(PENDING_WORK_SQL, cutoff, limit)
 
-    for task in tasks:
-        days = task["days_until"] or 0
-        if days < 0:
-            priority = TaskPriority.OVERDUE
-        elif days == 0:
-            priority = TaskPriority.DUE_TODAY
-        else:
-            priority = TaskPriority.REGULAR_STUDY
-        all_items.append({
-            **dict(task),
-            "computed_priority": priority + (task["priority"] or 5),
-            "estimated_mins": task["duration_mins"] or 60
-        })
+    items = [
+        {
+            **{field: row[field] for field in PENDING_ITEM_FIELDS[row["item_type"]]},
+            "computed_priority": row["computed_priority"],
+            "estimated_mins": row["estimated_mins"]
+        }
+        for row in rows
+    ]
+    return items, (rows[0]["total_count"] if rows else 0)
 
-    # Sort by computed priority (highest first)
-    all_items.sort(key=lambda x: -x["computed_priority"])
 
-    return all_items
+async def get_pending_work_items(days_ahead: int = 14, limit: Optional[int] = None) -> List[Dict]:
+    """
+    Get all pending work items that need to be scheduled.
+    Includes: revisions, assignments, lab reports, goals with deadlines.
+    Items come back highest computed_priority first, at most limit of them.
+    """
+    items, _ = await _pending_work_page(days_ahead, limit)
+    return items
 
 
 async def backward_plan_deadline(
@@ -1159,15 +1299,14 @@ async def backward_plan_deadline(
 
     # Find all available slots between now and deadline
     all_slots = []
-    for i in range(days_available):
-        target_date = today + timedelta(days=i)
-        gaps = await analyze_day_gaps(target_date)
-
-        for gap in gaps["gaps"]:
+    analyses = await analyze_gaps_for_range(today, days_available)
+    for offset, analysis in enumerate(analyses):
+        for gap in analysis["gaps"]:
             if gap["duration_mins"] >= 30:  # Minimum useful block
                 all_slots.append({
-                    "date": str(target_date),
-                    "day": target_date.strftime("%A"),
+                    "date": analysis["date"],
+                    "day": analysis["day"],
+                    "days_to_deadline": days_available - offset,
                     **gap
                 })
 
@@ -1181,8 +1320,7 @@ async def backward_plan_deadline(
         if remaining_mins <= 0:
             break
 
-        slot_date = datetime.strptime(slot["date"], "%Y-%m-%d").date()
-        days_to_deadline = (deadline_date - slot_date).days
+        days_to_deadline = slot["days_to_deadline"]
 
         # Weight: closer to deadline = allocate more
         weight = max(0.5, 1.0 - (days_to_deadline / days_available))
@@ -1255,22 +1393,24 @@ async def schedule_revision_with_spaced_repetition(
             "existing": list(existing)
         }
 
-    # Create revision entries
-    created = []
-    for i, days in enumerate(intervals):
-        rev_date = today + timedelta(days=days)
+    # Create all revision entries in one statement
+    revision_dates = [today + timedelta(days=days) for days in intervals]
+    revision_numbers = list(range(1, len(intervals) + 1))
 
-        revision = await db.execute_returning("""
-            INSERT INTO revision_schedule (chapter_id, revision_number, due_date)
-            VALUES ($1, $2, $3)
-            RETURNING *
-        """, chapter_id, i + 1, rev_date)
+    await db.execute("""
+        INSERT INTO revision_schedule (chapter_id, revision_number, due_date)
+        SELECT $1, revision_number, due_date
+        FROM unnest($2::int[], $3::date[]) AS r(revision_number, due_date)
+    """, chapter_id, revision_numbers, revision_dates)
 
-        created.append({
-            "revision_number": i + 1,
+    created = [
+        {
+            "revision_number": number,
             "due_date": str(rev_date),
             "days_from_now": days
-        })
+        }
+        for number, rev_date, days in zip(revision_numbers, revision_dates, intervals)
+    ]
 
     return {
         "success": True,
@@ -1288,7 +1428,6 @@ async def allocate_free_time(target_date: date, mins_desired: int = 60) -> Dict:
     Places free time in low-energy periods.
     """
     gaps = await analyze_day_gaps(target_date)
-    config = await get_user_schedule_config()
 
     allocated_free_time = []
     remaining_mins = mins_desired
@@ -1298,8 +1437,7 @@ async def allocate_free_time(target_date: date, mins_desired: int = 60) -> Dict:
             break
 
         # Check energy level for this time slot
-        start_hour = int(gap["start"].split(":")[0])
-        energy = get_energy_level(start_hour)
+        energy = _ENERGY_BY_HOUR[gap["start_mins"] // 60]
 
         # Prefer low-energy slots for free time
         if energy <= 5 and gap["duration_mins"] >= 30:
@@ -1321,12 +1459,19 @@ async def allocate_free_time(target_date: date, mins_desired: int = 60) -> Dict:
     }
 
 
-async def optimize_day_schedule(target_date: date) -> Dict:
+async def optimize_day_schedule(
+    target_date: date,
+    pending_items: Optional[List[Dict]] = None
+) -> Dict:
     """
     Main optimization function - creates the best possible schedule for a day.
     Considers: energy levels, priorities, deadlines, breaks, and preferences.
+
+    Args:
+        target_date: Day to plan
+        pending_items: Output of get_pending_work_items(14), if the caller
+            already has it (it is only read, never modified)
     """
-    config = await get_user_schedule_config()
     day_name = target_date.strftime("%A")
 
     # Get fixed events
@@ -1334,7 +1479,8 @@ async def optimize_day_schedule(target_date: date) -> Dict:
     gaps = await analyze_day_gaps(target_date)
 
     # Get pending work items
-    pending_items = await get_pending_work_items(14)
+    if pending_items is None:
+        pending_items = await get_pending_work_items(14)
 
     # Filter items that could be scheduled today
     schedulable = [item for item in pending_items if item["estimated_mins"] > 0]
@@ -1351,20 +1497,24 @@ async def optimize_day_schedule(target_date: date) -> Dict:
         best_gap_idx = None
         best_score = -1
 
+        # Per-item terms of the score, hoisted out of the gap loop
+        estimated_mins = item["estimated_mins"]
+        priority_level = item["computed_priority"] / 100
+        wants_deep_work = estimated_mins >= 60
+
         for idx, gap in enumerate(remaining_gaps):
-            if gap["duration_mins"] < item["estimated_mins"]:
+            if gap["duration_mins"] < estimated_mins:
                 continue
 
             # Score this gap based on:
             # 1. Energy level match
-            start_hour = int(gap["start"].split(":")[0])
-            energy = get_energy_level(start_hour)
+            energy = _ENERGY_BY_HOUR[gap["start_mins"] // 60]
 
             # High-priority items should go in high-energy slots
-            energy_match = 1 - abs((item["computed_priority"] / 100) - (energy / 10))
+            energy_match = 1 - abs(priority_level - (energy / 10))
 
             # 2. Deep work suitability
-            deep_work_bonus = 1.0 if gap["is_deep_work_suitable"] and item["estimated_mins"] >= 60 else 0
+            deep_work_bonus = 1.0 if wants_deep_work and gap["is_deep_work_suitable"] else 0
 
             score = energy_match + deep_work_bonus
 
@@ -1382,19 +1532,20 @@ async def optimize_day_schedule(target_date: date) -> Dict:
                 "title": item.get("title") or item.get("chapter_title") or item.get("experiment_name"),
                 "subject": item.get("subject_code"),
                 "start": gap["start"],
+                "start_mins": gap["start_mins"],
                 "duration_mins": duration,
                 "priority": item["computed_priority"],
                 "is_deep_work": gap["is_deep_work_suitable"] and duration >= 60
             })
 
             # Update remaining gap
-            gap_start_mins = time_to_minutes(parse_time(gap["start"]))
-            new_gap_start_mins = gap_start_mins + duration
+            new_gap_start_mins = gap["start_mins"] + duration
 
             if gap["duration_mins"] - duration >= 30:
                 remaining_gaps[best_gap_idx] = {
                     **gap,
-                    "start": minutes_to_time(new_gap_start_mins).strftime("%H:%M"),
+                    "start": format_minutes(new_gap_start_mins),
+                    "start_mins": new_gap_start_mins,
                     "duration_mins": gap["duration_mins"] - duration,
                     "is_deep_work_suitable": (gap["duration_mins"] - duration) >= DEEP_WORK_MIN_MINUTES
                 }
@@ -1408,11 +1559,12 @@ async def optimize_day_schedule(target_date: date) -> Dict:
 
         # Add break after 90+ min blocks
         if block["duration_mins"] >= 90 and i < len(schedule) - 1:
-            block_end_mins = time_to_minutes(parse_time(block["start"])) + block["duration_mins"]
+            block_end_mins = block["start_mins"] + block["duration_mins"]
             final_schedule.append({
                 "item_type": "break",
                 "title": "Short Break",
-                "start": minutes_to_time(block_end_mins).strftime("%H:%M"),
+                "start": format_minutes(block_end_mins),
+                "start_mins": block_end_mins,
                 "duration_mins": 15,
                 "is_deep_work": False
             })
@@ -1435,20 +1587,31 @@ async def get_weekly_timeline(start_date: Optional[date] = None) -> Dict:
     if not start_date:
         start_date = date.today()
 
-    weekly_data = []
+    # Serve a background re-plan while no task has been written since
+    replanned = _replanned_weeks.get(start_date)
+    if (replanned and replanned[0] == _schedule_version
+            and monotonic() - replanned[1] < GAP_CACHE_TTL_SECONDS):
+        return replanned[2]
+
+    # Pending work is the same for every day, so load it (and the config
+    # holding the weekly targets) once, then plan the days concurrently
+    pending_items, config = await asyncio.gather(
+        get_pending_work_items(14),
+        get_user_schedule_config()
+    )
+    weekly_data = await asyncio.gather(*(
+        optimize_day_schedule(start_date + timedelta(days=i), pending_items)
+        for i in range(7)
+    ))
+
     total_study_mins = 0
     total_deep_work_mins = 0
-
-    for i in range(7):
-        target_date = start_date + timedelta(days=i)
-        day_schedule = await optimize_day_schedule(target_date)
-
-        weekly_data.append(day_schedule)
+    items_scheduled = 0
+    for day_schedule in weekly_data:
         total_study_mins += day_schedule["total_study_mins"]
         total_deep_work_mins += day_schedule["deep_work_mins"]
+        items_scheduled += day_schedule["items_scheduled"]
 
-    # Get weekly targets
-    config = await get_user_schedule_config()
     targets = config.get("weekly_targets", {})
 
     return {
@@ -1460,7 +1623,7 @@ async def get_weekly_timeline(start_date: Optional[date] = None) -> Dict:
             "total_study_hours": round(total_study_mins / 60, 1),
             "total_deep_work_mins": total_deep_work_mins,
             "deep_work_hours": round(total_deep_work_mins / 60, 1),
-            "items_scheduled": sum(d["items_scheduled"] for d in weekly_data)
+            "items_scheduled": items_scheduled
         },
         "targets": targets,
         "target_met": {
@@ -1474,6 +1637,45 @@ async def get_weekly_timeline(start_date: Optional[date] = None) -> Dict:
 # AI SCHEDULE CONTROL FUNCTIONS
 # ============================================
 
+# task_type stored for each AI activity type; unknown activities are study
+_ACTIVITY_TASK_TYPE = {
+    "study": "study",
+    "revision": "revision",
+    "practice": "practice",
+    "assignment": "assignment",
+    "lab_work": "lab_work",
+    "deep_work": "study",
+}
+
+# Subject code -> id, refreshed after SUBJECT_ID_CACHE_TTL_SECONDS or when a
+# subject is created
+_subject_id_cache: Optional[tuple] = None
+SUBJECT_ID_CACHE_TTL_SECONDS = 60
+
+
+def invalidate_subject_id_cache() -> None:
+    """Forget the cached subject code lookup."""
+    global _subject_id_cache
+    _subject_id_cache = None
+
+
+async def _get_subject_id(code: str) -> Optional[int]:
+    global _subject_id_cache
+    now = monotonic()
+    if _subject_id_cache is None or now - _subject_id_cache[0] >= SUBJECT_ID_CACHE_TTL_SECONDS:
+        rows = await db.fetch("SELECT id, code FROM subjects")
+        _subject_id_cache = (now, {r["code"]: r["id"] for r in rows})
+    return _subject_id_cache[1].get(code.upper())
+
+
+# Preference keys ai_update_schedule_preference accepts
+SCHEDULE_PREFERENCE_KEYS = frozenset((
+    "sleep_start", "sleep_end", "preferred_study_times",
+    "max_study_block_mins", "commute_mins", "wake_time",
+    "lunch_time", "dinner_time"
+))
+
+
 async def ai_create_time_block(
     block_date: date,
     start_time: str,
@@ -1490,24 +1692,10 @@ async def ai_create_time_block(
     start_dt = datetime.combine(block_date, parse_time(start_time))
 
     # Get subject ID if provided
-    subject_id = None
-    if subject_code:
-        subject = await db.fetch_one(
-            "SELECT id FROM subjects WHERE code = $1",
-            subject_code.upper()
-        )
-        if subject:
-            subject_id = subject["id"]
+    subject_id = await _get_subject_id(subject_code) if subject_code else None
 
     # Map activity type to task type
-    task_type = {
-        "study": "study",
-        "revision": "revision",
-        "practice": "practice",
-        "assignment": "assignment",
-        "lab_work": "lab_work",
-        "deep_work": "study",
-    }.get(activity_type, "study")
+    task_type = _ACTIVITY_TASK_TYPE.get(activity_type, "study")
 
     task = await db.execute_returning("""
         INSERT INTO tasks (
@@ -1524,6 +1712,7 @@ async def ai_create_time_block(
         duration_mins >= DEEP_WORK_MIN_MINUTES,
         task_type
     )
+    invalidate_gap_cache()
 
     return {
         "success": True,
@@ -1532,6 +1721,47 @@ async def ai_create_time_block(
     }
 
 
+async def ai_create_time_blocks(blocks: List[Dict]) -> Dict:
+    """
+    AI tool to create several time blocks at once.
+    Each block takes the same fields as ai_create_time_block; all of them
+    are inserted in one statement.
+    """
+    if not blocks:
+        return {"success": True, "tasks": [], "message": "No blocks to create"}
+
+    titles, subject_ids, starts, durations, priorities, deep_flags, task_types = [], [], [], [], [], [], []
+    for block in blocks:
+        subject_code = block.get("subject_code")
+        duration_mins = block["duration_mins"]
+        titles.append(block["title"])
+        subject_ids.append(await _get_subject_id(subject_code) if subject_code else None)
+        starts.append(datetime.combine(block["block_date"], parse_time(block["start_time"])))
+        durations.append(duration_mins)
+        priorities.append(block.get("priority", 5))
+        deep_flags.append(duration_mins >= DEEP_WORK_MIN_MINUTES)
+        task_types.append(_ACTIVITY_TASK_TYPE.get(block["activity_type"], "study"))
+
+    tasks = await db.fetch("""
+        INSERT INTO tasks (
+            title, subject_id, scheduled_start, duration_mins,
+            priority, is_deep_work, task_type
+        )
+        SELECT title, subject_id, scheduled_start, duration_mins, priority, is_deep_work, task_type
+        FROM unnest($1::text[], $2::int[], $3::timestamptz[], $4::int[], $5::int[], $6::bool[], $7::text[])
+            WITH ORDINALITY AS b(title, subject_id, scheduled_start, duration_mins, priority, is_deep_work, task_type, ord)
+        ORDER BY ord
+        RETURNING *
+    """, titles, subject_ids, starts, durations, priorities, deep_flags, task_types)
+    invalidate_gap_cache()
+
+    return {
+        "success": True,
+        "tasks": tasks,
+        "message": f"Created {len(tasks)} time blocks"
+    }
+
+
 async def ai_move_time_block(task_id: int, new_date: date, new_start: str) -> Dict:
     """
     AI tool to move a scheduled block to a new time.
@@ -1545,6 +1775,7 @@ async def ai_move_time_block(task_id: int, new_date: date, new_start: str) -> Di
         WHERE id = $2
         RETURNING *
     """, new_start_dt, task_id)
+    invalidate_gap_cache()
 
     if not task:
         return {"error": "Task not found"}
@@ -1562,6 +1793,7 @@ async def ai_delete_time_block(task_id: int) -> Dict:
         "DELETE FROM tasks WHERE id = $1 RETURNING id",
         task_id
     )
+    invalidate_gap_cache()
 
     if not result:
         return {"error": "Task not found"}
@@ -1569,6 +1801,39 @@ async def ai_delete_time_block(task_id: int) -> Dict:
     return {"success": True, "message": f"Deleted task {task_id}"}
 
 
+# Background re-plans after a reschedule; the lock keeps concurrent
+# reschedules from recomputing the week side by side
+_replan_lock = asyncio.Lock()
+_background_tasks: Set[asyncio.Task] = set()
+
+# Re-planned weeks keyed by start date -> (schedule version, computed_at,
+# timeline); get_weekly_timeline serves them until the next task write
+_replanned_weeks: Dict[date, tuple] = {}
+
+
+async def _replan_week(start_date: date, reason: str) -> None:
+    """Rebuild the weekly timeline, keep it for get_weekly_timeline and tell
+    the user it is ready."""
+    from notifications import create_notification, NotificationType
+
+    async with _replan_lock:
+        try:
+            version = _schedule_version
+            week_schedule = await get_weekly_timeline(start_date)
+            _replanned_weeks[start_date] = (version, monotonic(), week_schedule)
+            await create_notification(
+                notif_type=NotificationType.SUGGESTION,
+                title="Schedule updated",
+                message=f"Your week has been re-planned ({reason}): "
+                        f"{week_schedule['summary']['items_scheduled']} items scheduled.",
+                action_url="/schedule",
+                action_label="View Schedule"
+            )
+        except Exception as e:
+            await log_system("error", "Weekly re-plan after reschedule failed",
+                             {"start_date": start_date, "reason": reason, "error": str(e)})
+
+
 async def ai_reschedule_all(reason: str) -> Dict:
     """
     AI tool to reschedule all pending tasks.
@@ -1576,42 +1841,37 @@ async def ai_reschedule_all(reason: str) -> Dict:
     """
     today = date.today()
 
-    # Get all pending tasks
+    # Clear existing schedules for next 7 days, returning what was cleared
     pending = await db.fetch("""
-        SELECT t.*, s.code as subject_code
-        FROM tasks t
-        LEFT JOIN subjects s ON t.subject_id = s.id
-        WHERE t.status = 'pending'
-          AND DATE(t.scheduled_start) >= $1
-        ORDER BY t.priority DESC, t.scheduled_start
+        UPDATE tasks SET scheduled_start = NULL, updated_at = NOW()
+        WHERE status = 'pending'
+          AND scheduled_start >= $1::date
+          AND scheduled_start < $1::date + 8
+        RETURNING id, priority
     """, today)
 
     if not pending:
         return {"message": "No pending tasks to reschedule"}
 
-    # Clear existing schedules for next 7 days
-    await db.execute("""
-        UPDATE tasks SET scheduled_start = NULL
-        WHERE status = 'pending'
-          AND DATE(scheduled_start) >= $1
-          AND DATE(scheduled_start) <= $1 + INTERVAL '7 days'
-    """, today)
+    invalidate_gap_cache()
 
-    # Re-run optimization for next week
-    week_schedule = await get_weekly_timeline(today)
+    # Re-run optimization for next week in the background; the new plan is
+    # served by get_weekly_timeline and announced with a notification
+    task = asyncio.create_task(_replan_week(today, reason))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
     # Log the reschedule
-    await db.execute("""
-        INSERT INTO system_logs (level, message, context)
-        VALUES ('info', 'AI rescheduled all pending tasks', $1)
-    """, {"reason": reason, "tasks_affected": len(pending)})
+    await log_system("info", "AI rescheduled all pending tasks",
+                     {"reason": reason, "tasks_affected": len(pending)})
 
     return {
         "success": True,
         "tasks_rescheduled": len(pending),
         "reason": reason,
-        "new_schedule": week_schedule,
-        "message": f"Rescheduled {len(pending)} tasks due to: {reason}"
+        "new_schedule": None,
+        "status": "recomputing",
+        "message": f"Rescheduled {len(pending)} tasks due to: {reason}. The new weekly plan will follow as a notification; get_weekly_timeline returns it once ready."
     }
 
 
@@ -1622,14 +1882,8 @@ async def ai_update_schedule_preference(key: str, value: str) -> Dict:
     """
     from database import save_ai_memory
 
-    valid_keys = [
-        "sleep_start", "sleep_end", "preferred_study_times",
-        "max_study_block_mins", "commute_mins", "wake_time",
-        "lunch_time", "dinner_time"
-    ]
-
-    if key not in valid_keys:
-        return {"error": f"Invalid preference key. Valid keys: {valid_keys}"}
+    if key not in SCHEDULE_PREFERENCE_KEYS:
+        return {"error": f"Invalid preference key. Valid keys: {sorted(SCHEDULE_PREFERENCE_KEYS)}"}
 
     await save_ai_memory("schedule", key, value)
 
@@ -1646,35 +1900,35 @@ async def ai_get_schedule_context() -> Dict:
     AI tool to get full scheduling context.
     Used by AI to understand current situation before making decisions.
     """
-    today = date.today()
-
-    # Today's schedule
-    today_schedule = await get_today_at_glance()
-
-    # Pending items
-    pending = await get_pending_work_items(7)
-
-    # Weekly load
-    week_stats = await db.fetch_one("""
-        SELECT
-            COUNT(*) as total_tasks,
-            SUM(duration_mins) as total_mins,
-            SUM(CASE WHEN is_deep_work THEN duration_mins ELSE 0 END) as deep_work_mins
-        FROM tasks
-        WHERE status = 'pending'
-          AND DATE(scheduled_start) >= $1
-          AND DATE(scheduled_start) <= $1 + INTERVAL '7 days'
-    """, today)
-
-    # User preferences
-    config = await get_user_schedule_config()
+    now = datetime.now()
+    today = now.date()
+
+    today_schedule, (pending, pending_count), week_stats, config = await asyncio.gather(
+        # Today's schedule
+        get_today_at_glance(),
+        # Top 10 most urgent pending items
+        _pending_work_page(7, 10),
+        # Weekly load
+        db.fetch_one("""
+            SELECT
+                COUNT(*) as total_tasks,
+                SUM(duration_mins) as total_mins,
+                SUM(CASE WHEN is_deep_work THEN duration_mins ELSE 0 END) as deep_work_mins
+            FROM tasks
+            WHERE status = 'pending'
+              AND scheduled_start >= $1::date
+              AND scheduled_start < $1::date + 8
+        """, today),
+        # User preferences
+        get_user_schedule_config()
+    )
 
     return {
         "today": today_schedule,
-        "pending_items": pending[:10],  # Top 10 most urgent
-        "pending_count": len(pending),
+        "pending_items": pending,
+        "pending_count": pending_count,
         "week_stats": week_stats,
         "preferences": config,
-        "current_time": datetime.now().strftime("%H:%M"),
-        "current_energy": get_energy_level(datetime.now().hour)
+        "current_time": now.strftime("%H:%M"),
+        "current_energy": get_energy_level(now.hour)
     }
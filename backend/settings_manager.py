@@ -1,27 +1,57 @@
 
 import os
 import dotenv
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from pathlib import Path
 from logger import logger
 
 ENV_PATH = Path(__file__).parent / ".env"
 
+# Parsed .env as (st_mtime_ns, values); re-parsed only when the file changes
+_settings_cache: Optional[Tuple[int, Dict[str, str]]] = None
+
+# UI-manageable settings by category:
+# (key, label, type, default, description, extra input attributes)
+_SETTINGS_SCHEMA = (
+    ("AI Configuration", (
+        ("AI_API_BASE_URL", "API Base URL", "text", "https://api.openai.com/v1",
+         "Endpoint for OpenAI-compatible API", {}),
+        ("AI_API_KEY", "API Key", "password", "",
+         "Your API Key", {}),
+        ("AI_MODEL_NAME", "Model Name", "select", "gpt-4",
+         "AI Model to use for reasoning",
+         {"options": ["gpt-4", "gpt-3.5-turbo", "claude-3-sonnet", "llama3"]}),
+    )),
+    ("Schedule", (
+        ("SLEEP_START_HOUR", "Sleep Start Hour", "number", "23",
+         "Hour to start sleep block (0-23)", {"min": 0, "max": 23}),
+        ("SLEEP_DURATION", "Sleep Duration (Hours)", "number", "7.0",
+         "Target sleep duration", {"step": 0.5}),
+    )),
+)
+
 class SettingsManager:
     """Manages reading and writing of environment settings"""
     
     @staticmethod
     def get_all_settings() -> Dict[str, str]:
         """Read all settings from .env"""
-        if not ENV_PATH.exists():
+        global _settings_cache
+        try:
+            mtime = os.stat(ENV_PATH).st_mtime_ns
+        except FileNotFoundError:
             logger.warning(f".env file not found at {ENV_PATH}")
             return {}
-            
-        return dotenv.dotenv_values(ENV_PATH)
+
+        if _settings_cache is None or _settings_cache[0] != mtime:
+            _settings_cache = (mtime, dotenv.dotenv_values(ENV_PATH))
+
+        return dict(_settings_cache[1])
 
     @staticmethod
     def update_setting(key: str, value: str) -> bool:
         """Update a specific setting in .env"""
+        global _settings_cache
         try:
             # Create .env if it doesn't exist
             if not ENV_PATH.exists():
@@ -29,9 +59,28 @@ class SettingsManager:
                 with open(ENV_PATH, 'w') as f:
                     f.write("")
             
-            dotenv.set_key(ENV_PATH, key, value)
+            current = SettingsManager.get_all_settings()
+            if current.get(key) == value:
+                os.environ[key] = value
+                return True
+
+            if key in current:
+                dotenv.set_key(ENV_PATH, key, value)
+            else:
+                # New key: append in set_key's quoting instead of rewriting the file
+                escaped = value.replace("'", "\\'")
+                line = f"{key}='{escaped}'\n".encode()
+                with open(ENV_PATH, 'rb+') as f:
+                    if f.seek(0, os.SEEK_END):
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b"\n":
+                            line = b"\n" + line
+                    f.write(line)
             logger.info(f"Updated setting {key} = {value}")
-            
+
+            current[key] = value
+            _settings_cache = (os.stat(ENV_PATH).st_mtime_ns, current)
+
             # Also update current environment for immediate effect (where possible)
             os.environ[key] = value
             
@@ -44,55 +93,21 @@ class SettingsManager:
     def get_manageable_settings() -> List[Dict[str, Any]]:
         """Return a schema of settings that can be managed in UI"""
         current = SettingsManager.get_all_settings()
-        
+
         return [
             {
-                "category": "AI Configuration",
+                "category": category,
                 "settings": [
                     {
-                        "key": "AI_API_BASE_URL",
-                        "label": "API Base URL",
-                        "type": "text",
-                        "value": current.get("AI_API_BASE_URL", "https://api.openai.com/v1"),
-                        "description": "Endpoint for OpenAI-compatible API"
-                    },
-                    {
-                        "key": "AI_API_KEY",
-                        "label": "API Key",
-                        "type": "password",
-                        "value": current.get("AI_API_KEY", ""),
-                        "description": "Your API Key"
-                    },
-                    {
-                        "key": "AI_MODEL_NAME",
-                        "label": "Model Name",
-                        "type": "select",
-                        "options": ["gpt-4", "gpt-3.5-turbo", "claude-3-sonnet", "llama3"],
-                        "value": current.get("AI_MODEL_NAME", "gpt-4"),
-                        "description": "AI Model to use for reasoning"
-                    }
-                ]
-            },
-            {
-                "category": "Schedule",
-                "settings": [
-                    {
-                        "key": "SLEEP_START_HOUR",
-                        "label": "Sleep Start Hour",
-                        "type": "number",
-                        "min": 0,
-                        "max": 23,
-                        "value": current.get("SLEEP_START_HOUR", "23"),
-                        "description": "Hour to start sleep block (0-23)"
-                    },
-                    {
-                        "key": "SLEEP_DURATION",
-                        "label": "Sleep Duration (Hours)",
-                        "type": "number",
-                        "step": 0.5,
-                        "value": current.get("SLEEP_DURATION", "7.0"),
-                        "description": "Target sleep duration"
+                        "key": key,
+                        "label": label,
+                        "type": input_type,
+                        **extras,
+                        "value": current.get(key, default),
+                        "description": description
                     }
+                    for key, label, input_type, default, description, extras in settings
                 ]
             }
+            for category, settings in _SETTINGS_SCHEMA
         ]
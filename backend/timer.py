@@ -3,10 +3,18 @@ Personal Engineering OS - Study Timer Module
 Track study sessions with analytics and deep work detection
 """
 
+import asyncio
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional, List, Set
 
-from database import db
+import orjson
+
+from database import db, log_system
+
+
+# Post-stop tasks still running; holding a reference keeps them from being
+# garbage collected mid-flight
+_background_tasks: Set[asyncio.Task] = set()
 
 
 # ============================================
@@ -34,40 +42,46 @@ async def start_timer(
     title: Optional[str] = None
 ) -> dict:
     """Start a new study session timer."""
-    # Check if timer already running
-    active = await get_active_timer()
-    if active:
+    # Claim the single active_timer row first: if a timer is already running
+    # (or another start wins the race) ON CONFLICT DO NOTHING leaves claim
+    # empty and no session is created. The session id is drawn up front so
+    # the pointer can be written before the session row; the foreign key is
+    # checked at the end of the statement.
+    row = await db.execute_returning("""
+        WITH claim AS (
+            INSERT INTO active_timer (id, session_id, started_at, subject_id, chapter_id, title)
+            VALUES (1, nextval(pg_get_serial_sequence('study_sessions', 'id')), NOW(), $1, $2, $3)
+            ON CONFLICT (id) DO NOTHING
+            RETURNING session_id
+        ), new_session AS (
+            INSERT INTO study_sessions (id, subject_id, chapter_id, title, started_at)
+            SELECT session_id, $1, $2, $3, NOW() FROM claim
+            RETURNING *
+        )
+        SELECT
+            ns.*,
+            s.code as subject_code,
+            s.name as subject_name,
+            s.color as subject_color
+        FROM new_session ns
+        LEFT JOIN subjects s ON ns.subject_id = s.id
+    """, subject_id, chapter_id, title)
+
+    if not row:
         return {
             "success": False,
             "error": "Timer already running",
-            "active_timer": active
+            "active_timer": await get_active_timer()
         }
 
-    # Create session record
-    session = await db.execute_returning("""
-        INSERT INTO study_sessions (subject_id, chapter_id, title, started_at)
-        VALUES ($1, $2, $3, NOW())
-        RETURNING *
-    """, subject_id, chapter_id, title)
+    subject_code = row.pop('subject_code')
+    subject_name = row.pop('subject_name')
+    subject_color = row.pop('subject_color')
+    session = row
 
-    # Create active timer pointer
-    await db.execute("""
-        INSERT INTO active_timer (id, session_id, started_at, subject_id, chapter_id, title)
-        VALUES (1, $1, NOW(), $2, $3, $4)
-        ON CONFLICT (id) DO UPDATE SET
-            session_id = $1,
-            started_at = NOW(),
-            subject_id = $2,
-            chapter_id = $3,
-            title = $4
-    """, session['id'], subject_id, chapter_id, title)
-
-    # Get subject info for response
     subject_info = None
-    if subject_id:
-        subject_info = await db.fetch_one(
-            "SELECT code, name, color FROM subjects WHERE id = $1", subject_id
-        )
+    if subject_code is not None:
+        subject_info = {"code": subject_code, "name": subject_name, "color": subject_color}
 
     return {
         "success": True,
@@ -77,6 +91,16 @@ async def start_timer(
     }
 
 
+async def _update_patterns_after_stop(session_id: int) -> None:
+    """Learn from a finished session; runs off the request path."""
+    try:
+        from learning_patterns import update_patterns_from_session
+        await update_patterns_from_session(session_id)
+    except Exception as e:
+        await log_system("error", "Pattern update after timer stop failed",
+                         {"session_id": session_id, "error": str(e)})
+
+
 async def stop_timer() -> dict:
     """Stop the active timer and finalize session."""
     active = await get_active_timer()
@@ -104,20 +128,19 @@ async def stop_timer() -> dict:
 
     duration_str = f"{hours}h {mins}m" if hours > 0 else f"{mins} minutes"
 
-    # Update learning patterns from this session
-    try:
-        from learning_patterns import update_patterns_from_session
-        await update_patterns_from_session(session['id'])
-    except Exception:
-        pass  # Don't fail timer stop if pattern update fails
+    # Pattern learning doesn't affect the response, so it runs in the background
+    task = asyncio.create_task(_update_patterns_after_stop(session['id']))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
     # Check for newly earned achievements after study session
     earned_achievements = []
     try:
         from achievements import check_achievements_after_action
         earned_achievements = await check_achievements_after_action("study_session")
-    except Exception:
-        pass  # Don't fail timer stop if achievement check fails
+    except Exception as e:
+        await log_system("error", "Achievement check after timer stop failed",
+                         {"session_id": session['id'], "error": str(e)})
 
     return {
         "success": True,
@@ -141,25 +164,6 @@ async def get_study_sessions(
     limit: int = 50
 ) -> List[dict]:
     """Get past study sessions with optional filters."""
-    if subject_id:
-        return await db.fetch("""
-            SELECT
-                ss.*,
-                s.code as subject_code,
-                s.name as subject_name,
-                s.color,
-                c.number as chapter_number,
-                c.title as chapter_title
-            FROM study_sessions ss
-            LEFT JOIN subjects s ON ss.subject_id = s.id
-            LEFT JOIN chapters c ON ss.chapter_id = c.id
-            WHERE ss.stopped_at IS NOT NULL
-              AND ss.started_at >= NOW() - INTERVAL '%s days'
-              AND ss.subject_id = $1
-            ORDER BY ss.started_at DESC
-            LIMIT $2
-        """ % days, subject_id, limit)
-
     return await db.fetch("""
         SELECT
             ss.*,
@@ -172,10 +176,11 @@ async def get_study_sessions(
         LEFT JOIN subjects s ON ss.subject_id = s.id
         LEFT JOIN chapters c ON ss.chapter_id = c.id
         WHERE ss.stopped_at IS NOT NULL
-          AND ss.started_at >= NOW() - INTERVAL '%s days'
+          AND ss.started_at >= NOW() - $1::int * INTERVAL '1 day'
+          AND ($2::int IS NULL OR ss.subject_id = $2)
         ORDER BY ss.started_at DESC
-        LIMIT $1
-    """ % days, limit)
+        LIMIT $3
+    """, days, subject_id or None, limit)
 
 
 # ============================================
@@ -185,87 +190,81 @@ async def get_study_sessions(
 async def get_study_analytics(days: int = 7) -> dict:
     """Get comprehensive study time analytics."""
 
-    # Daily breakdown
-    daily_stats = await db.fetch("""
-        SELECT
-            DATE(started_at) as date,
-            SUM(duration_seconds) as total_seconds,
-            COUNT(*) as session_count,
-            SUM(CASE WHEN is_deep_work THEN duration_seconds ELSE 0 END) as deep_work_seconds,
-            SUM(points_earned) as points
-        FROM study_sessions
-        WHERE started_at >= NOW() - INTERVAL '%s days'
-          AND stopped_at IS NOT NULL
-        GROUP BY DATE(started_at)
-        ORDER BY date
-    """ % days)
-
-    # By subject breakdown
-    by_subject = await db.fetch("""
-        SELECT
-            s.id,
-            s.code,
-            s.name,
-            s.color,
-            SUM(ss.duration_seconds) as total_seconds,
-            COUNT(*) as session_count,
-            AVG(ss.duration_seconds) as avg_session_seconds
-        FROM study_sessions ss
-        JOIN subjects s ON ss.subject_id = s.id
-        WHERE ss.started_at >= NOW() - INTERVAL '%s days'
-          AND ss.stopped_at IS NOT NULL
-        GROUP BY s.id
-        ORDER BY total_seconds DESC
-    """ % days)
-
-    # Overall totals
-    totals = await db.fetch_one("""
-        SELECT
-            COALESCE(SUM(duration_seconds), 0) as total_seconds,
-            COUNT(*) as total_sessions,
-            COALESCE(AVG(duration_seconds), 0) as avg_session_seconds,
-            COALESCE(SUM(CASE WHEN is_deep_work THEN duration_seconds ELSE 0 END), 0) as deep_work_seconds,
-            COALESCE(SUM(points_earned), 0) as total_points
-        FROM study_sessions
-        WHERE started_at >= NOW() - INTERVAL '%s days'
-          AND stopped_at IS NOT NULL
-    """ % days)
-
-    # Today's stats
-    today = await db.fetch_one("""
+    # One scan of the window's sessions feeds every rollup. The window is
+    # widened to cover today even when it starts later than midnight; the
+    # in_window flag keeps period figures to the requested days.
+    stats = await db.fetch_one("""
+        WITH filtered AS (
+            SELECT
+                subject_id, started_at, duration_seconds, is_deep_work, points_earned,
+                started_at >= NOW() - $1::int * INTERVAL '1 day' as in_window
+            FROM study_sessions
+            WHERE stopped_at IS NOT NULL
+              AND started_at >= LEAST(NOW() - $1::int * INTERVAL '1 day', CURRENT_DATE::timestamptz)
+        ),
+        daily AS (
+            SELECT
+                DATE(started_at) as date,
+                SUM(duration_seconds) as total_seconds,
+                COUNT(*) as session_count,
+                SUM(CASE WHEN is_deep_work THEN duration_seconds ELSE 0 END) as deep_work_seconds,
+                SUM(points_earned) as points
+            FROM filtered
+            WHERE in_window
+            GROUP BY DATE(started_at)
+        ),
+        by_subject AS (
+            SELECT
+                s.id,
+                s.code,
+                s.name,
+                s.color,
+                SUM(f.duration_seconds) as total_seconds,
+                COUNT(*) as session_count,
+                AVG(f.duration_seconds) as avg_session_seconds
+            FROM filtered f
+            JOIN subjects s ON f.subject_id = s.id
+            WHERE f.in_window
+            GROUP BY s.id
+        )
         SELECT
-            COALESCE(SUM(duration_seconds), 0) as total_seconds,
-            COUNT(*) as session_count,
-            COALESCE(SUM(CASE WHEN is_deep_work THEN duration_seconds ELSE 0 END), 0) as deep_work_seconds
-        FROM study_sessions
-        WHERE DATE(started_at) = CURRENT_DATE
-          AND stopped_at IS NOT NULL
-    """)
+            (SELECT COALESCE(json_agg(d ORDER BY d.date), '[]') FROM daily d) as daily,
+            (SELECT COALESCE(json_agg(b ORDER BY b.total_seconds DESC), '[]') FROM by_subject b) as by_subject,
+            COALESCE(SUM(duration_seconds) FILTER (WHERE in_window), 0) as total_seconds,
+            COUNT(*) FILTER (WHERE in_window) as total_sessions,
+            COALESCE(AVG(duration_seconds) FILTER (WHERE in_window), 0) as avg_session_seconds,
+            COALESCE(SUM(duration_seconds) FILTER (WHERE in_window AND is_deep_work), 0) as deep_work_seconds,
+            COALESCE(SUM(points_earned) FILTER (WHERE in_window), 0) as total_points,
+            COALESCE(SUM(duration_seconds) FILTER (WHERE started_at >= CURRENT_DATE), 0) as today_seconds,
+            COUNT(*) FILTER (WHERE started_at >= CURRENT_DATE) as today_sessions,
+            COALESCE(SUM(duration_seconds) FILTER (WHERE started_at >= CURRENT_DATE AND is_deep_work), 0) as today_deep_work_seconds
+        FROM filtered
+    """, days)
 
     # Format totals
-    total_hours = (totals['total_seconds'] or 0) / 3600
-    deep_work_hours = (totals['deep_work_seconds'] or 0) / 3600
+    total_hours = stats['total_seconds'] / 3600
+    deep_work_hours = stats['deep_work_seconds'] / 3600
     deep_work_ratio = deep_work_hours / total_hours * 100 if total_hours > 0 else 0
 
     return {
         "period_days": days,
-        "daily": daily_stats,
-        "by_subject": by_subject,
+        "daily": orjson.loads(stats['daily']),
+        "by_subject": orjson.loads(stats['by_subject']),
         "totals": {
-            "total_seconds": totals['total_seconds'],
+            "total_seconds": stats['total_seconds'],
             "total_hours": round(total_hours, 1),
-            "total_sessions": totals['total_sessions'],
-            "avg_session_minutes": round((totals['avg_session_seconds'] or 0) / 60, 1),
-            "deep_work_seconds": totals['deep_work_seconds'],
+            "total_sessions": stats['total_sessions'],
+            "avg_session_minutes": round(stats['avg_session_seconds'] / 60, 1),
+            "deep_work_seconds": stats['deep_work_seconds'],
             "deep_work_hours": round(deep_work_hours, 1),
             "deep_work_ratio": round(deep_work_ratio, 1),
-            "total_points": totals['total_points']
+            "total_points": stats['total_points']
         },
         "today": {
-            "total_seconds": today['total_seconds'],
-            "total_minutes": round((today['total_seconds'] or 0) / 60, 1),
-            "session_count": today['session_count'],
-            "deep_work_seconds": today['deep_work_seconds']
+            "total_seconds": stats['today_seconds'],
+            "total_minutes": round(stats['today_seconds'] / 60, 1),
+            "session_count": stats['today_sessions'],
+            "deep_work_seconds": stats['today_deep_work_seconds']
         }
     }
 
@@ -279,8 +278,8 @@ async def get_productivity_by_hour(days: int = 30) -> List[dict]:
             AVG(duration_seconds) as avg_duration,
             SUM(CASE WHEN is_deep_work THEN 1 ELSE 0 END)::FLOAT / COUNT(*) * 100 as deep_work_rate
         FROM study_sessions
-        WHERE started_at >= NOW() - INTERVAL '%s days'
+        WHERE started_at >= NOW() - $1::int * INTERVAL '1 day'
           AND stopped_at IS NOT NULL
-        GROUP BY EXTRACT(HOUR FROM started_at)
+        GROUP BY hour
         ORDER BY hour
-    """ % days)
+    """, days)
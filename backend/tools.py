@@ -3,12 +3,16 @@ Personal Engineering OS - AI Tools
 Function definitions for copilot-api tool calling
 """
 
+import asyncio
 import os
-import subprocess
+import re
 import json
+from time import monotonic
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any, List
 
+import orjson
+
 from database import (
     get_all_subjects, get_subject_by_code, create_subject,
     get_chapters_by_subject, create_chapter, update_chapter_progress, get_chapter,
@@ -25,12 +29,15 @@ from database import (
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
 ENGINE_PATH = os.getenv("ENGINE_PATH", "../engine/scheduler")
 
+# Subject code naming convention, e.g. MATH101
+SUBJECT_CODE_RE = re.compile(r"^[A-Z]{4}[0-9]{3}$")
+
 
 # ============================================
 # TOOL DEFINITIONS (for AI to call)
 # ============================================
 
-TOOL_DEFINITIONS = [
+TOOL_DEFINITIONS = (
     {
         "type": "function",
         "function": {
@@ -535,6 +542,40 @@ TOOL_DEFINITIONS = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "create_time_blocks_bulk",
+            "description": "Create several time blocks in one call. Prefer this over repeated create_time_block calls when planning multiple sessions.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "blocks": {
+                        "type": "array",
+                        "description": "Blocks to create, each with the same fields as create_time_block",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "date": {"type": "string", "description": "ISO date for the block (YYYY-MM-DD)"},
+                                "start_time": {"type": "string", "description": "Start time in HH:MM format (24-hour)"},
+                                "duration_mins": {"type": "integer", "description": "Duration in minutes"},
+                                "activity_type": {
+                                    "type": "string",
+                                    "enum": ["study", "revision", "practice", "assignment", "lab_work", "deep_work", "break", "free_time"],
+                                    "description": "Type of activity"
+                                },
+                                "title": {"type": "string", "description": "Title/description of the block"},
+                                "subject_code": {"type": "string", "description": "Optional subject code (e.g., MATH101)"},
+                                "priority": {"type": "integer", "description": "Priority 1-10 (default 5)"}
+                            },
+                            "required": ["date", "start_time", "duration_mins", "activity_type", "title"]
+                        }
+                    }
+                },
+                "required": ["blocks"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -924,7 +965,11 @@ TOOL_DEFINITIONS = [
             }
         }
     }
-]
+)
+
+# The tool schema is static, so it is encoded once; orjson embeds the
+# fragment verbatim when the chat request body is serialized
+TOOL_DEFINITIONS_JSON = orjson.Fragment(orjson.dumps(TOOL_DEFINITIONS))
 
 
 # ============================================
@@ -934,73 +979,9 @@ TOOL_DEFINITIONS = [
 async def execute_tool(name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
     """Execute a tool by name and return the result."""
 
-    handlers = {
-        "edit_schedule": tool_edit_schedule,
-        "analyze_gaps": tool_analyze_gaps,
-        "get_lab_status": tool_get_lab_status,
-        "update_chapter_progress": tool_update_chapter_progress,
-        "get_revision_queue": tool_get_revision_queue,
-        "complete_revision": tool_complete_revision,
-        "save_memory": tool_save_memory,
-        "get_memory": tool_get_memory,
-        "add_guideline": tool_add_guideline,
-        "list_guidelines": tool_list_guidelines,
-        "create_folder_supervised": tool_create_folder_supervised,
-        "send_notification": tool_send_notification,
-        "get_streak_status": tool_get_streak_status,
-        "morning_briefing": tool_morning_briefing,
-        # Timer tools
-        "start_study_timer": tool_start_study_timer,
-        "stop_study_timer": tool_stop_study_timer,
-        "get_timer_status": tool_get_timer_status,
-        "get_study_stats": tool_get_study_stats,
-        # Scheduler tools
-        "get_today_schedule": tool_get_today_schedule,
-        "get_week_schedule": tool_get_week_schedule,
-        "find_deep_work_slots": tool_find_deep_work_slots,
-        "schedule_event_prep": tool_schedule_event_prep,
-        "get_lab_reports": tool_get_lab_reports_tool,
-        "add_lab_report": tool_add_lab_report,
-        "update_lab_report": tool_update_lab_report,
-        "get_upcoming_deadlines": tool_get_upcoming_deadlines,
-        # Goal tools
-        "create_study_goal": tool_create_study_goal,
-        "update_goal_progress": tool_update_goal_progress,
-        "get_goals": tool_get_goals,
-        "get_goals_summary": tool_get_goals_summary,
-        # AI Schedule Control tools
-        "create_time_block": tool_create_time_block,
-        "move_time_block": tool_move_time_block,
-        "delete_time_block": tool_delete_time_block,
-        "get_optimized_schedule": tool_get_optimized_schedule,
-        "get_weekly_timeline": tool_get_weekly_timeline_schedule,
-        "reschedule_all": tool_reschedule_all,
-        "backward_plan": tool_backward_plan,
-        "schedule_chapter_revision": tool_schedule_chapter_revision,
-        "allocate_free_time": tool_allocate_free_time,
-        "update_schedule_preference": tool_update_schedule_preference,
-        "get_schedule_context": tool_get_schedule_context,
-        "get_pending_items": tool_get_pending_items,
-        "get_full_timeline": tool_get_full_timeline,
-        # Enhanced AI Memory tools
-        "remember_user_info": tool_remember_user_info,
-        "recall_memories": tool_recall_memories,
-        "forget_memory": tool_forget_memory,
-        # Proactive Notification tools
-        "send_proactive_notification": tool_send_proactive_notification,
-        "schedule_reminder": tool_schedule_reminder,
-        # C Engine Optimization tools
-        "optimize_weekly_timeline": tool_optimize_weekly_timeline,
-        "fill_micro_gaps": tool_fill_micro_gaps,
-        "get_schedule_gaps": tool_get_schedule_gaps,
-        # Progress Tracking tools
-        "get_progress_summary": tool_get_progress_summary,
-        "get_subject_progress": tool_get_subject_progress,
-        "trigger_notifications_check": tool_trigger_notifications_check,
-    }
-    
-    handler = handlers.get(name)
-    if not handler:
+    try:
+        handler = _TOOL_HANDLERS[name]
+    except KeyError:
         return {"error": f"Unknown tool: {name}"}
     
     try:
@@ -1038,34 +1019,79 @@ async def tool_edit_schedule(args: Dict[str, Any]) -> Dict[str, Any]:
     return {"error": "Invalid action"}
 
 
+# Engine binary availability as (monotonic time, available), re-checked after
+# ENGINE_CHECK_TTL_SECONDS so a freshly compiled engine is picked up
+_engine_check: Optional[tuple] = None
+ENGINE_CHECK_TTL_SECONDS = 60
+
+
+def _engine_available() -> bool:
+    global _engine_check
+    now = monotonic()
+    if _engine_check is None or now - _engine_check[0] >= ENGINE_CHECK_TTL_SECONDS:
+        available = os.path.isfile(ENGINE_PATH) and os.access(ENGINE_PATH, os.X_OK)
+        _engine_check = (now, available)
+    return _engine_check[1]
+
+
+def _mock_gaps_result() -> Dict[str, Any]:
+    """Fallback gap analysis used when the C engine isn't compiled."""
+    return {
+        "success": True,
+        "gaps": {
+            "gaps": [
+                {"start": "04:30", "end": "08:00", "duration_mins": 210},
+                {"start": "14:00", "end": "16:30", "duration_mins": 150}
+            ],
+            "count": 2
+        },
+        "note": "Using mock data - compile C engine for real analysis"
+    }
+
+
+# Last engine gap analysis as (schedule version, monotonic time, result);
+# reused until the schedule changes or ENGINE_GAPS_CACHE_TTL_SECONDS pass
+_engine_gaps_cache: Optional[tuple] = None
+ENGINE_GAPS_CACHE_TTL_SECONDS = 30
+
+
 async def tool_analyze_gaps(args: Dict[str, Any]) -> Dict[str, Any]:
     """Call C engine to analyze deep work gaps."""
+    global _engine_gaps_cache
+    from scheduler import schedule_version
+
+    if not _engine_available():
+        return _mock_gaps_result()
+
+    version = schedule_version()
+    if (_engine_gaps_cache and _engine_gaps_cache[0] == version
+            and monotonic() - _engine_gaps_cache[1] < ENGINE_GAPS_CACHE_TTL_SECONDS):
+        return _engine_gaps_cache[2]
+
     try:
-        result = subprocess.run(
-            [ENGINE_PATH, "--analyze-gaps", "--json"],
-            capture_output=True,
-            text=True,
-            timeout=10
+        # Run the engine without blocking the event loop
+        proc = await asyncio.create_subprocess_exec(
+            ENGINE_PATH, "--analyze-gaps", "--json",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
         )
-        
-        if result.returncode == 0:
-            gaps = json.loads(result.stdout)
-            return {"success": True, "gaps": gaps}
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=10)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return {"success": False, "error": "Gap analysis timed out after 10 seconds"}
+
+        if proc.returncode == 0:
+            gaps = json.loads(stdout)
+            result = {"success": True, "gaps": gaps}
+            _engine_gaps_cache = (version, monotonic(), result)
+            return result
         else:
-            return {"success": False, "error": result.stderr}
+            return {"success": False, "error": stderr.decode()}
     except FileNotFoundError:
-        # Fallback: return mock data if engine not compiled
-        return {
-            "success": True,
-            "gaps": {
-                "gaps": [
-                    {"start": "04:30", "end": "08:00", "duration_mins": 210},
-                    {"start": "14:00", "end": "16:30", "duration_mins": 150}
-                ],
-                "count": 2
-            },
-            "note": "Using mock data - compile C engine for real analysis"
-        }
+        # Engine removed since the last availability check
+        return _mock_gaps_result()
     except Exception as e:
         return {"success": False, "error": str(e)}
 
@@ -1129,10 +1155,12 @@ async def tool_get_revision_queue(args: Dict[str, Any]) -> Dict[str, Any]:
 async def tool_complete_revision(args: Dict[str, Any]) -> Dict[str, Any]:
     """Mark revision complete and award points."""
     revision = await complete_revision(args["revision_id"], points=15)
-    await add_points(15)
-    
-    streak = await get_streak()
-    
+    if not revision:
+        return {"error": f"Revision {args['revision_id']} not found"}
+
+    # add_points returns the updated streak row, so no separate get_streak
+    streak = await add_points(15)
+
     return {
         "success": True,
         "revision": revision,
@@ -1180,8 +1208,7 @@ async def tool_create_folder_supervised(args: Dict[str, Any]) -> Dict[str, Any]:
     chapter_title = args["chapter_title"]
     
     # Validate naming convention
-    import re
-    if not re.match(r"^[A-Z]{4}[0-9]{3}$", subject_code):
+    if not SUBJECT_CODE_RE.match(subject_code):
         return {"error": f"Invalid subject code format: {subject_code}. Use format like MATH101"}
     
     # Create folder structure
@@ -1228,16 +1255,20 @@ async def tool_get_streak_status(args: Dict[str, Any]) -> Dict[str, Any]:
 
 async def tool_morning_briefing(args: Dict[str, Any]) -> Dict[str, Any]:
     """Generate morning briefing."""
-    tasks = await get_tasks_today()
-    revisions = await get_pending_revisions()
-    streak = await get_streak()
-    notifications = await get_unread_notifications()
+    tasks, revisions, streak, notifications = await asyncio.gather(
+        get_tasks_today(),
+        get_pending_revisions(),
+        get_streak(),
+        get_unread_notifications()
+    )
     
     # Calculate available deep work time
     # This would normally come from C engine
     deep_work_mins = 360  # Mock: 6 hours
     
-    hour = datetime.now().hour
+    now = datetime.now()
+    today = now.date()
+    hour = now.hour
     if hour < 12:
         greeting = "Good morning! ☀️"
     elif hour < 17:
@@ -1252,7 +1283,7 @@ async def tool_morning_briefing(args: Dict[str, Any]) -> Dict[str, Any]:
             "current_streak": streak["current_streak"],
             "streak_icon": "🔥" if streak["current_streak"] >= 3 else "",
             "tasks_today": len(tasks),
-            "revisions_due": len([r for r in revisions if str(r.get("due_date")) == str(datetime.now().date())]),
+            "revisions_due": sum(1 for r in revisions if r["due_date"] == today),
             "deep_work_available": deep_work_mins,
             "unread_notifications": len(notifications),
             "next_reward": streak.get("next_reward"),
@@ -1265,16 +1296,30 @@ async def tool_morning_briefing(args: Dict[str, Any]) -> Dict[str, Any]:
 # SYSTEM PROMPT BUILDER
 # ============================================
 
+# Built prompt as (monotonic time, text). Cleared whenever guidelines or
+# memories change; the TTL covers edits made outside this process.
+_system_prompt_cache: Optional[tuple] = None
+SYSTEM_PROMPT_CACHE_TTL_SECONDS = 300
+
+
+def invalidate_system_prompt_cache() -> None:
+    """Drop the cached system prompt after guidelines or memories change."""
+    global _system_prompt_cache
+    _system_prompt_cache = None
+
+
 async def build_system_prompt() -> str:
     """Build system prompt with guidelines and memory."""
+    global _system_prompt_cache
+    if _system_prompt_cache and monotonic() - _system_prompt_cache[0] < SYSTEM_PROMPT_CACHE_TTL_SECONDS:
+        return _system_prompt_cache[1]
 
-    guidelines = await get_ai_guidelines()
-    memories = await get_ai_memory()
+    guidelines, memories = await asyncio.gather(get_ai_guidelines(), get_ai_memory())
 
-    guidelines_text = "\n".join([f"- {g['rule']}" for g in guidelines])
-    memories_text = "\n".join([f"- {m['category']}/{m['key']}: {m['value']}" for m in memories])
+    guidelines_text = "\n".join(f"- {g['rule']}" for g in guidelines)
+    memories_text = "\n".join(f"- {m['category']}/{m['key']}: {m['value']}" for m in memories)
 
-    return f"""You are the AI assistant for a Personal Engineering OS, helping a KU CS student manage their studies.
+    prompt = f"""You are the AI assistant for a Personal Engineering OS, helping a KU CS student manage their studies.
 
 ## Your Guidelines (MUST FOLLOW):
 {guidelines_text}
@@ -1299,6 +1344,7 @@ async def build_system_prompt() -> str:
 
 ### Schedule Control Tools (AI has FULL control):
 - create_time_block: Create new study/revision/assignment blocks in calendar
+- create_time_blocks_bulk: Create several blocks in one call
 - move_time_block: Move existing blocks to new times
 - delete_time_block: Remove blocks from schedule
 - get_optimized_schedule: Get AI-optimized day schedule
@@ -1354,6 +1400,8 @@ async def build_system_prompt() -> str:
 
 Always be helpful, proactive about study habits, and encouraging about streaks!
 """
+    _system_prompt_cache = (monotonic(), prompt)
+    return prompt
 
 
 # ============================================
@@ -1494,7 +1542,7 @@ async def tool_schedule_event_prep(args: Dict[str, Any]) -> Dict[str, Any]:
 
 async def tool_get_lab_reports_tool(args: Dict[str, Any]) -> Dict[str, Any]:
     """Get pending lab reports with countdown."""
-    from scheduler import get_lab_report_countdown
+    from scheduler import get_lab_report_countdown, URGENT_LAB_URGENCIES
 
     reports = await get_lab_report_countdown()
 
@@ -1505,7 +1553,7 @@ async def tool_get_lab_reports_tool(args: Dict[str, Any]) -> Dict[str, Any]:
         "success": True,
         "reports": reports,
         "count": len(reports),
-        "urgent_count": len([r for r in reports if r["urgency"] in ("overdue", "urgent")])
+        "urgent_count": sum(1 for r in reports if r["urgency"] in URGENT_LAB_URGENCIES)
     }
 
 
@@ -1668,6 +1716,25 @@ async def tool_create_time_block(args: Dict[str, Any]) -> Dict[str, Any]:
     )
 
 
+async def tool_create_time_blocks_bulk(args: Dict[str, Any]) -> Dict[str, Any]:
+    """Create several time blocks in one insert."""
+    from scheduler import ai_create_time_blocks
+    from datetime import datetime
+
+    return await ai_create_time_blocks([
+        {
+            "block_date": datetime.fromisoformat(block["date"]).date(),
+            "start_time": block["start_time"],
+            "duration_mins": block["duration_mins"],
+            "activity_type": block["activity_type"],
+            "title": block["title"],
+            "subject_code": block.get("subject_code"),
+            "priority": block.get("priority", 5)
+        }
+        for block in args["blocks"]
+    ])
+
+
 async def tool_move_time_block(args: Dict[str, Any]) -> Dict[str, Any]:
     """Move a scheduled block to a new time."""
     from scheduler import ai_move_time_block
@@ -1864,6 +1931,7 @@ async def tool_forget_memory(args: Dict[str, Any]) -> Dict[str, Any]:
         WHERE category = $1 AND key = $2
         RETURNING id
     """, args["category"], args["key"])
+    invalidate_system_prompt_cache()
 
     if result:
         return {
@@ -1911,7 +1979,7 @@ async def tool_send_proactive_notification(args: Dict[str, Any]) -> Dict[str, An
 
 async def tool_schedule_reminder(args: Dict[str, Any]) -> Dict[str, Any]:
     """Schedule a reminder notification for a future time."""
-    from notifications import create_notification
+    from notifications import create_notification, make_dedup_key
     from datetime import datetime
 
     try:
@@ -1929,7 +1997,7 @@ async def tool_schedule_reminder(args: Dict[str, Any]) -> Dict[str, Any]:
         message=args["message"],
         priority=args.get("priority", "normal"),
         scheduled_for=scheduled_time,
-        dedup_key=f"scheduled_reminder_{args['title']}_{scheduled_time.isoformat()}"
+        dedup_key=make_dedup_key("scheduled_reminder", args["title"], scheduled_time.isoformat())
     )
 
     if notif:
@@ -2298,3 +2366,75 @@ async def tool_trigger_notifications_check(args: Dict[str, Any]) -> Dict[str, An
             "message": f"Notification check failed: {str(e)}"
         }
 
+
+# ============================================
+# TOOL DISPATCH
+# ============================================
+
+# Tool name -> implementation used by execute_tool; built once, after every
+# handler above is defined
+_TOOL_HANDLERS = {
+    "edit_schedule": tool_edit_schedule,
+    "analyze_gaps": tool_analyze_gaps,
+    "get_lab_status": tool_get_lab_status,
+    "update_chapter_progress": tool_update_chapter_progress,
+    "get_revision_queue": tool_get_revision_queue,
+    "complete_revision": tool_complete_revision,
+    "save_memory": tool_save_memory,
+    "get_memory": tool_get_memory,
+    "add_guideline": tool_add_guideline,
+    "list_guidelines": tool_list_guidelines,
+    "create_folder_supervised": tool_create_folder_supervised,
+    "send_notification": tool_send_notification,
+    "get_streak_status": tool_get_streak_status,
+    "morning_briefing": tool_morning_briefing,
+    # Timer tools
+    "start_study_timer": tool_start_study_timer,
+    "stop_study_timer": tool_stop_study_timer,
+    "get_timer_status": tool_get_timer_status,
+    "get_study_stats": tool_get_study_stats,
+    # Scheduler tools
+    "get_today_schedule": tool_get_today_schedule,
+    "get_week_schedule": tool_get_week_schedule,
+    "find_deep_work_slots": tool_find_deep_work_slots,
+    "schedule_event_prep": tool_schedule_event_prep,
+    "get_lab_reports": tool_get_lab_reports_tool,
+    "add_lab_report": tool_add_lab_report,
+    "update_lab_report": tool_update_lab_report,
+    "get_upcoming_deadlines": tool_get_upcoming_deadlines,
+    # Goal tools
+    "create_study_goal": tool_create_study_goal,
+    "update_goal_progress": tool_update_goal_progress,
+    "get_goals": tool_get_goals,
+    "get_goals_summary": tool_get_goals_summary,
+    # AI Schedule Control tools
+    "create_time_block": tool_create_time_block,
+    "create_time_blocks_bulk": tool_create_time_blocks_bulk,
+    "move_time_block": tool_move_time_block,
+    "delete_time_block": tool_delete_time_block,
+    "get_optimized_schedule": tool_get_optimized_schedule,
+    "get_weekly_timeline": tool_get_weekly_timeline_schedule,
+    "reschedule_all": tool_reschedule_all,
+    "backward_plan": tool_backward_plan,
+    "schedule_chapter_revision": tool_schedule_chapter_revision,
+    "allocate_free_time": tool_allocate_free_time,
+    "update_schedule_preference": tool_update_schedule_preference,
+    "get_schedule_context": tool_get_schedule_context,
+    "get_pending_items": tool_get_pending_items,
+    "get_full_timeline": tool_get_full_timeline,
+    # Enhanced AI Memory tools
+    "remember_user_info": tool_remember_user_info,
+    "recall_memories": tool_recall_memories,
+    "forget_memory": tool_forget_memory,
+    # Proactive Notification tools
+    "send_proactive_notification": tool_send_proactive_notification,
+    "schedule_reminder": tool_schedule_reminder,
+    # C Engine Optimization tools
+    "optimize_weekly_timeline": tool_optimize_weekly_timeline,
+    "fill_micro_gaps": tool_fill_micro_gaps,
+    "get_schedule_gaps": tool_get_schedule_gaps,
+    # Progress Tracking tools
+    "get_progress_summary": tool_get_progress_summary,
+    "get_subject_progress": tool_get_subject_progress,
+    "trigger_notifications_check": tool_trigger_notifications_check,
+}
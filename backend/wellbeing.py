@@ -671,15 +671,23 @@ async def get_break_stats(days: int = 7) -> Dict[str, Any]:
         ORDER BY count DESC
     ''' % days)
 
-    # Daily breakdown
+    # Daily breakdown with a trailing 7-calendar-day rolling window computed
+    # in SQL. Only days with breaks have rows, so the window is a RANGE over
+    # the date rather than the last 7 rows, and the mean divides by 7 days.
     daily = await db.fetch('''
         SELECT
             DATE(started_at) as date,
             COUNT(*) as breaks,
-            COALESCE(SUM(actual_duration_mins), 0) as total_mins
+            COALESCE(SUM(actual_duration_mins), 0) as total_mins,
+            ROUND(SUM(COALESCE(SUM(actual_duration_mins), 0)) OVER w / 7.0, 1) as rolling_7d_mins,
+            (SUM(COUNT(*)) OVER w)::int as rolling_7d_breaks
         FROM break_sessions
         WHERE started_at >= NOW() - INTERVAL '%s days'
         GROUP BY DATE(started_at)
+        WINDOW w AS (
+            ORDER BY DATE(started_at)
+            RANGE BETWEEN INTERVAL '6 days' PRECEDING AND CURRENT ROW
+        )
         ORDER BY date
     ''' % days)
 
@@ -829,42 +837,58 @@ async def get_wellbeing_trends(days: int = 30) -> Dict[str, Any]:
     Returns:
         Dict with trend analysis
     """
-    history = await get_wellbeing_history(days)
+    # Rank days newest-first so the recent/previous week windows and the
+    # stress distribution are all aggregated in a single pass
+    stats = await db.fetch_one('''
+        WITH ranked AS (
+            SELECT
+                wellbeing_score,
+                study_hours,
+                break_count,
+                ROW_NUMBER() OVER (ORDER BY metric_date DESC) as rn
+            FROM wellbeing_metrics
+            WHERE metric_date >= CURRENT_DATE - INTERVAL '%s days'
+        )
+        SELECT
+            COUNT(*) as data_points,
+            AVG(wellbeing_score) as avg_score,
+            MAX(wellbeing_score) FILTER (WHERE rn = 1) as current_score,
+            AVG(wellbeing_score) FILTER (WHERE rn <= 7) as recent_avg,
+            AVG(wellbeing_score) FILTER (WHERE rn BETWEEN 8 AND 14) as older_avg,
+            COUNT(*) FILTER (WHERE wellbeing_score < 0.4) as high_stress_days,
+            COUNT(*) FILTER (WHERE wellbeing_score >= 0.4 AND wellbeing_score < 0.7) as moderate_stress_days,
+            COALESCE(AVG(study_hours), 0) as avg_study_hours,
+            COALESCE(AVG(break_count), 0) as avg_breaks
+        FROM ranked
+    ''' % days)
 
-    if not history:
+    data_points = stats['data_points'] if stats else 0
+    if not data_points:
         return {
             "period_days": days,
             "has_data": False,
             "message": "No wellbeing data available for this period"
         }
 
-    scores = [h['wellbeing_score'] for h in history]
-    avg_score = sum(scores) / len(scores)
-
     # Calculate trend (positive = improving)
-    if len(scores) >= 7:
-        recent_avg = sum(scores[:7]) / 7
-        older_avg = sum(scores[7:14]) / min(7, len(scores) - 7) if len(scores) > 7 else recent_avg
+    if data_points >= 7:
+        recent_avg = float(stats['recent_avg'])
+        older_avg = float(stats['older_avg']) if stats['older_avg'] is not None else recent_avg
         trend = recent_avg - older_avg
     else:
         trend = 0
 
-    # Count stress days
-    high_stress_days = sum(1 for h in history if h['stress_level'] == 'high')
-    moderate_stress_days = sum(1 for h in history if h['stress_level'] == 'moderate')
-
-    # Average metrics
-    avg_study_hours = sum(h['study_hours'] for h in history) / len(history)
-    avg_breaks = sum(h['break_count'] for h in history) / len(history)
+    high_stress_days = stats['high_stress_days']
+    moderate_stress_days = stats['moderate_stress_days']
 
     trend_direction = "improving" if trend > 0.05 else "declining" if trend < -0.05 else "stable"
 
     return {
         "period_days": days,
         "has_data": True,
-        "data_points": len(history),
-        "average_score": round(avg_score, 2),
-        "current_score": history[0]['wellbeing_score'] if history else None,
+        "data_points": data_points,
+        "average_score": round(float(stats['avg_score']), 2),
+        "current_score": stats['current_score'],
         "trend": {
             "direction": trend_direction,
             "change": round(trend, 2)
@@ -872,11 +896,11 @@ async def get_wellbeing_trends(days: int = 30) -> Dict[str, Any]:
         "stress_distribution": {
             "high_stress_days": high_stress_days,
             "moderate_stress_days": moderate_stress_days,
-            "low_stress_days": len(history) - high_stress_days - moderate_stress_days
+            "low_stress_days": data_points - high_stress_days - moderate_stress_days
         },
         "averages": {
-            "study_hours_per_day": round(avg_study_hours, 1),
-            "breaks_per_day": round(avg_breaks, 1)
+            "study_hours_per_day": round(float(stats['avg_study_hours']), 1),
+            "breaks_per_day": round(float(stats['avg_breaks']), 1)
         }
     }
 
@@ -99,6 +99,7 @@ CREATE TABLE tasks (
 
 CREATE INDEX idx_tasks_scheduled ON tasks(scheduled_start);
 CREATE INDEX idx_tasks_status ON tasks(status);
+CREATE INDEX idx_tasks_pending_scheduled ON tasks(scheduled_start) WHERE status = 'pending';
 
 -- Lab reports (enhanced)
 CREATE TABLE lab_reports (
@@ -343,6 +344,8 @@ CREATE TABLE study_sessions (
 
 CREATE INDEX idx_study_sessions_date ON study_sessions(started_at);
 CREATE INDEX idx_study_sessions_subject ON study_sessions(subject_id);
+-- Completed sessions only, for the timer analytics windows
+CREATE INDEX idx_ss_started_completed ON study_sessions(started_at) WHERE stopped_at IS NOT NULL;
 
 -- Active timer tracking (single row ensures only one timer runs)
 CREATE TABLE active_timer (
@@ -1168,3 +1171,37 @@ CREATE TRIGGER tr_update_break_duration
     BEFORE UPDATE ON break_sessions
     FOR EACH ROW
     EXECUTE FUNCTION update_break_duration();
+
+-- ============================================
+-- NOTIFICATION SERVICE WAKEUP
+-- ============================================
+
+-- Wake the notification service (LISTEN notif_wakeup) whenever data it
+-- checks changes, instead of waiting for the next polling interval
+CREATE OR REPLACE FUNCTION notify_notification_wakeup()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('notif_wakeup', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tr_notif_wakeup_tasks
+    AFTER INSERT OR UPDATE OR DELETE ON tasks
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_notification_wakeup();
+
+CREATE TRIGGER tr_notif_wakeup_lab_reports
+    AFTER INSERT OR UPDATE OR DELETE ON lab_reports
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_notification_wakeup();
+
+CREATE TRIGGER tr_notif_wakeup_active_timer
+    AFTER INSERT OR UPDATE OR DELETE ON active_timer
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_notification_wakeup();
+
+CREATE TRIGGER tr_notif_wakeup_achievements
+    AFTER UPDATE ON achievements
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_notification_wakeup();
@@ -0,0 +1,78 @@
+-- ============================================
+-- Migration: 002_notification_performance.sql
+-- Description: Event-driven wakeups and indexes for the proactive
+--              notification service
+-- Date: 2026-10-16
+-- ============================================
+
+-- ============================================
+-- 1. NOTIFICATION SERVICE WAKEUP
+-- ============================================
+
+-- Wake the notification service (LISTEN notif_wakeup) whenever data it
+-- checks changes, instead of waiting for the next polling interval
+CREATE OR REPLACE FUNCTION notify_notification_wakeup()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('notif_wakeup', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tr_notif_wakeup_tasks ON tasks;
+CREATE TRIGGER tr_notif_wakeup_tasks
+    AFTER INSERT OR UPDATE OR DELETE ON tasks
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_notification_wakeup();
+
+DROP TRIGGER IF EXISTS tr_notif_wakeup_lab_reports ON lab_reports;
+CREATE TRIGGER tr_notif_wakeup_lab_reports
+    AFTER INSERT OR UPDATE OR DELETE ON lab_reports
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_notification_wakeup();
+
+DROP TRIGGER IF EXISTS tr_notif_wakeup_active_timer ON active_timer;
+CREATE TRIGGER tr_notif_wakeup_active_timer
+    AFTER INSERT OR UPDATE OR DELETE ON active_timer
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_notification_wakeup();
+
+DROP TRIGGER IF EXISTS tr_notif_wakeup_achievements ON achievements;
+CREATE TRIGGER tr_notif_wakeup_achievements
+    AFTER UPDATE ON achievements
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_notification_wakeup();
+
+-- ============================================
+-- 2. PROACTIVE NOTIFICATION INDEXES
+-- ============================================
+
+-- dedup_key is already backed by its UNIQUE constraint, which
+-- create_notification() targets with ON CONFLICT; the extra plain index
+-- only cost write amplification
+DROP INDEX IF EXISTS idx_proactive_notif_dedup;
+
+-- Partial index matching get_pending_notifications(): only unsent,
+-- undismissed rows, pre-ordered by priority rank then age
+DROP INDEX IF EXISTS idx_proactive_notif_pending;
+CREATE INDEX IF NOT EXISTS idx_proactive_notif_pending
+    ON proactive_notifications (
+        (CASE priority
+            WHEN 'urgent' THEN 1
+            WHEN 'high' THEN 2
+            WHEN 'normal' THEN 3
+            WHEN 'low' THEN 4
+        END),
+        created_at
+    )
+    WHERE sent = false AND dismissed = false;
+
+-- Supports check_achievements()' anti-join against already-notified
+-- achievements
+CREATE INDEX IF NOT EXISTS idx_proactive_notif_achievement_ref
+    ON proactive_notifications(reference_type, reference_id)
+    WHERE reference_type = 'achievement';
+
+-- ============================================
+-- END OF MIGRATION
+-- ============================================
@@ -0,0 +1,16 @@
+-- ============================================
+-- Migration: 003_study_session_indexes.sql
+-- Description: Partial index for completed study sessions
+-- Date: 2026-10-16
+-- ============================================
+
+-- Analytics, history and productivity queries only ever read stopped
+-- sessions within a started_at window. CONCURRENTLY keeps the timer
+-- writable during the build, so run this file outside a transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ss_started_completed
+    ON study_sessions (started_at)
+    WHERE stopped_at IS NOT NULL;
+
+-- ============================================
+-- END OF MIGRATION
+-- ============================================
@@ -0,0 +1,16 @@
+-- ============================================
+-- Migration: 004_pending_task_index.sql
+-- Description: Partial index for pending tasks by scheduled_start
+-- Date: 2026-10-16
+-- ============================================
+
+-- ai_reschedule_all and the week_stats rollup in ai_get_schedule_context
+-- both scan pending tasks over a scheduled_start range. Run this file
+-- outside a transaction (CONCURRENTLY).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_pending_scheduled
+    ON tasks (scheduled_start)
+    WHERE status = 'pending';
+
+-- ============================================
+-- END OF MIGRATION
+-- ============================================